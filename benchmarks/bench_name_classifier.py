@@ -0,0 +1,129 @@
+"""
+Micro-benchmark for the unit-name classifier used by process_xml_content().
+
+Compares the old per-block keyword regex loop against UnitNameClassifier,
+checks that both return the same decisions, and prints the per-block cost.
+
+Usage:
+    python benchmarks/bench_name_classifier.py
+    python benchmarks/bench_name_classifier.py --xml-dir ".../2794270450/Data/Xml"
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import eaw_remake_skirmish_god as god
+
+SEGMENTS = ["Star", "Destroyer", "Light", "Frigate", "Venator", "Corona", "Hapan", "Nova", "Battle", "Dragon",
+            "Mk2", "Elite", "Squadron", "Carrier", "Pirate", "Old", "Rep", "E", "R", "U", "H", "S", "CIS",
+            "Empire", "Rebel", "Republic", "Underworld", "CSA", "Mand", "Naboo", "Garrison", "G", "DUMMY",
+            "Crate", "Cost", "Test", "Walker", "Costa", "Strike", "Ea", "Rebels"]
+
+
+def legacy_classify(start_tag, faction_name):
+    """Classification as done per block before UnitNameClassifier (kept verbatim for comparison)."""
+    name_match = re.search(r'Name="([^"]+)"', start_tag, re.IGNORECASE)
+    unit_name = name_match.group(1) if name_match else None
+    if unit_name:
+        faction_keywords_map = {
+            "Republic": ["Republic", "Rep"],
+            "Empire": ["Empire", "E"],
+            "Rebellion": ["Rebel", "R"],
+            "CIS": ["CIS", "Confederacy"]
+        }
+        other_keywords = []
+        for fac, keywords in faction_keywords_map.items():
+            if fac != faction_name:
+                other_keywords.extend(keywords)
+        other_keywords.extend(["U", "Underworld", "HC", "Cartels", "CSA", "Warlords", "Hapan", "Mand", "Mandalorian", "H", "S", "Sith", "Naboo"])
+        for keyword in other_keywords:
+            for pattern in [f"^{keyword}_", f"_{keyword}_", f"_{keyword}$"]:
+                if re.search(pattern, unit_name, re.IGNORECASE):
+                    return "other_faction"
+    non_buildable_keywords = r'DUMMY|ORBITAL|DELETE_STRUCTURE|UPGRADE|DOWNGRADE|_Garrison(_|$)|_G(_|$)|Cost|UC_|Crate|Container|Ammo|Spawner|Debuff|Penalty|Death|Walker|Trooper|Infantry|Prop|Structure|Test|Marker|Loot|Treasure'
+    non_buildable = bool(unit_name and re.search(non_buildable_keywords, unit_name, re.IGNORECASE))
+    # The old code extracted the name a second time for debug tracking
+    name_match = re.search(r'Name="([^"]+)"', start_tag, re.IGNORECASE)
+    return "non_buildable" if non_buildable else "ok"
+
+
+def classifier_classify(start_tag, classifier):
+    name_match = god.NAME_ATTR_PATTERN.search(start_tag)
+    unit_name = name_match.group(1) if name_match else None
+    if unit_name and classifier.belongs_to_other_faction(unit_name):
+        return "other_faction"
+    return "non_buildable" if unit_name and classifier.is_non_buildable(unit_name) else "ok"
+
+
+def synthetic_start_tags(count, seed):
+    rng = random.Random(seed)
+    tags = []
+    for _ in range(count):
+        segments = [rng.choice(SEGMENTS) for _ in range(rng.randint(1, 5))]
+        name = "_".join(seg.lower() if rng.random() < 0.1 else seg for seg in segments)
+        if rng.random() < 0.05:
+            name = "_" + name if rng.random() < 0.5 else name + "_"
+        tags.append(f'<SpaceUnit Name="{name}">')
+    return tags
+
+
+def start_tags_from_tree(xml_dir):
+    tags = []
+    for root, dirs, files in os.walk(xml_dir):
+        for file in files:
+            if not file.lower().endswith(".xml"): continue
+            try:
+                with open(os.path.join(root, file), 'r', encoding='utf-8') as f: content = f.read()
+            except (OSError, UnicodeDecodeError):
+                continue
+            tags.extend(match.group(1) for match in god.BLOCK_PATTERN.finditer(content))
+    return tags
+
+
+def time_per_block(func, start_tags, make_arg, repeat):
+    """Best per-block time in microseconds; make_arg() runs per repetition so memo caches start cold."""
+    best = None
+    for _ in range(repeat):
+        arg = make_arg()
+        started = time.perf_counter()
+        for start_tag in start_tags:
+            func(start_tag, arg)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(start_tags) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--xml-dir", help="Use block start tags from a real Data/Xml tree instead of synthetic names")
+    parser.add_argument("--blocks", type=int, default=20000, help="Number of synthetic blocks (default: 20000)")
+    parser.add_argument("--repeat", type=int, default=3, help="Timing repetitions, best is reported (default: 3)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    start_tags = start_tags_from_tree(args.xml_dir) if args.xml_dir else synthetic_start_tags(args.blocks, args.seed)
+    if not start_tags:
+        print("No blocks found.")
+        return 1
+
+    print(f"{len(start_tags)} block start tags")
+    print(f"{'Faction':<12}{'before (us/block)':>20}{'after (us/block)':>20}{'speedup':>10}")
+    for faction_name, _ in god.FACTIONS.values():
+        classifier = god.UnitNameClassifier(faction_name)
+        mismatches = [tag for tag in start_tags
+                      if legacy_classify(tag, faction_name) != classifier_classify(tag, classifier)]
+        if mismatches:
+            print(f"{faction_name}: {len(mismatches)} decision mismatch(es), e.g. {mismatches[:3]}")
+            return 1
+        before = time_per_block(legacy_classify, start_tags, lambda: faction_name, args.repeat)
+        after = time_per_block(classifier_classify, start_tags, lambda: god.UnitNameClassifier(faction_name), args.repeat)
+        print(f"{faction_name:<12}{before:>20.2f}{after:>20.2f}{before / after:>9.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+"""
+Stage benchmark for the whole tool on synthetic Remake-shaped trees.
+
+For each size, generates a tree (benchmarks/synthetic_tree.py) in a temp folder,
+points the tool at it and times process_xml_content() over every target file,
+inject_units_into_shipyard_rosters(), boost_starbase_income(), validate_final()
+and a full in-place run (restore, fixes, cheats, income, validation, write).
+Each size gets a checksum of the changed files; the staged chain and the full
+run must agree, and --save/--check compare checksums across versions of the tool.
+
+Usage:
+    python benchmarks/bench_pipeline.py --sizes 250,1000,4000
+    python benchmarks/bench_pipeline.py --save checksums.json
+    python benchmarks/bench_pipeline.py --check checksums.json
+"""
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+import eaw_remake_skirmish_god as god
+import synthetic_tree
+
+
+def point_tool_at(root_dir):
+    """Redirects the tool's folder globals to a generated tree."""
+    god.SCRIPT_DIR = root_dir
+    god.WORKING_DIR = os.path.join(root_dir, god.MOD_FOLDER_NAME)
+    god.XML_DIR = os.path.join(god.WORKING_DIR, "Data", "Xml")
+    god.BACKUP_DIR = os.path.join(root_dir, f"{god.MOD_FOLDER_NAME} - copy")
+
+
+def checksum(store):
+    """SHA-1 over every changed document (path and content), independent of write order."""
+    digest = hashlib.sha1()
+    for path in sorted(store.changed_paths(), key=store.rel_path):
+        content = store.changes.get(path)
+        if content is None:
+            content = store.read(path)
+        digest.update(store.rel_path(path).encode('utf-8') + b"\0")
+        digest.update(content if isinstance(content, bytes) else content.encode('utf-8'))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def timed(timings, name, func, *args, **kwargs):
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = func(*args, **kwargs)
+    timings[name] = time.perf_counter() - started
+    return result
+
+
+def staged_chain(faction_name, faction_pattern, jobs, timings):
+    """Runs each step on an in-memory store, timing the stages one by one."""
+    store = god.XmlDocumentStore(write_through=False)
+    timed(timings, "apply_fixes", god.apply_fixes, store)
+
+    file_paths = store.target_files(god.TARGET_DIRS)
+    documents = [(fp, store.read(fp)) for fp in file_paths]  # Reads are not part of the stage
+
+    def rewrite_all():
+        converted_units = []
+        for fp, content in documents:
+            new_content, units, _ = god.process_xml_content(content, faction_name, faction_pattern, fp)
+            converted_units.extend(units)
+            if new_content != content:
+                store.write(fp, new_content)
+        return converted_units
+
+    converted_units = timed(timings, "process_xml_content", rewrite_all)
+    timed(timings, "inject_units_into_shipyard_rosters", god.inject_units_into_shipyard_rosters,
+          faction_name, converted_units, store)
+    timed(timings, "boost_starbase_income", god.boost_starbase_income, faction_name, store)
+    timed(timings, "validate_final", god.validate_final, store, jobs)
+    return store, len(file_paths)
+
+
+def full_run(faction_name, faction_pattern, jobs):
+    """The in-place path of main(); returns its store after the flush."""
+    god.restore_backup()
+    store = god.XmlDocumentStore(write_through=False)
+    god.apply_fixes(store)
+    god.apply_cheats(faction_name, faction_pattern, jobs=jobs, store=store)
+    god.boost_starbase_income(faction_name, store)
+    god.validate_final(store, jobs)
+    store.flush()
+    return store
+
+
+def bench_size(files, faction_name, faction_pattern, jobs, seed):
+    root_dir = tempfile.mkdtemp(prefix="skirmish_god_bench_")
+    try:
+        synthetic_tree.generate(root_dir, files, seed=seed)
+        point_tool_at(root_dir)
+        timings = {}
+        with contextlib.redirect_stdout(io.StringIO()):
+            god.restore_backup()  # First run only creates the backup
+        store, target_count = staged_chain(faction_name, faction_pattern, jobs, timings)
+        chain_sum = checksum(store)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            full_run(faction_name, faction_pattern, jobs)  # Warms the manifest and unit catalog
+        full_store = timed(timings, "full_run", full_run, faction_name, faction_pattern, jobs)
+        full_sum = checksum(full_store)
+        return target_count, timings, chain_sum, full_sum
+    finally:
+        shutil.rmtree(root_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the tool's stages on synthetic trees")
+    parser.add_argument("--sizes", default="250,1000,4000", help="Comma-separated unit file counts (default: 250,1000,4000)")
+    parser.add_argument("--faction", default="1", help="Faction number (1-4) or name (default: 1)")
+    parser.add_argument("--jobs", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--save", metavar="PATH", help="Write the checksums to a JSON file")
+    parser.add_argument("--check", metavar="PATH", help="Compare the checksums with a saved JSON file")
+    args = parser.parse_args()
+
+    faction = god.select_faction(args.faction)
+    if faction is None:
+        print("Invalid faction.")
+        return 2
+    faction_name, faction_pattern = faction
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    print(f"Faction: {faction_name}, jobs: {args.jobs}, seed: {args.seed}")
+    checksums = {}
+    ok = True
+    for files in sizes:
+        target_count, timings, chain_sum, full_sum = bench_size(files, faction_name, faction_pattern, args.jobs, args.seed)
+        print(f"\n{files} unit files ({target_count} target files)")
+        for name, seconds in timings.items():
+            print(f"  {name:<36} {seconds:9.4f} s  {seconds / target_count * 1e6:9.1f} us/file")
+        print(f"  checksum {chain_sum}" + ("" if chain_sum == full_sum else f"  MISMATCH full run {full_sum}"))
+        ok &= chain_sum == full_sum
+        checksums[str(files)] = chain_sum
+
+    key = f"{faction_name}/seed{args.seed}"
+    if args.save:
+        saved = {}
+        if os.path.exists(args.save):
+            with open(args.save, 'r', encoding='utf-8') as f: saved = json.load(f)
+        saved[key] = checksums
+        with open(args.save, 'w', encoding='utf-8') as f: json.dump(saved, f, indent=1, sort_keys=True)
+        print(f"\nChecksums saved to {args.save}")
+    if args.check:
+        with open(args.check, 'r', encoding='utf-8') as f: expected = json.load(f).get(key, {})
+        for files, value in checksums.items():
+            if files in expected and expected[files] != value:
+                print(f"CHECKSUM CHANGED for {files} unit files: {expected[files]} -> {value}")
+                ok = False
+        print("\nChecksums match the saved run." if ok else "\nOutput differs from the saved run.")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
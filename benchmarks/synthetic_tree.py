@@ -0,0 +1,159 @@
+"""
+Generator for a synthetic, Remake-shaped mod tree used by the benchmarks.
+
+Writes <root>/2794270450/Data/Xml with the layout the tool expects:
+Units/Space (faction, Neutral/Underworld hero and squadron files), Units/Ground,
+Story folders that must be ignored, Buildings/Space/Skirmish/<Faction>/
+(Shipyards.xml, Starbases.xml, Research_Facilities.xml), Research and Upgrades,
+plus the files apply_fixes() repairs. The same seed always produces the same tree.
+
+Usage:
+    python benchmarks/synthetic_tree.py OUT_DIR --files 2000
+"""
+import argparse
+import os
+import random
+
+MOD_FOLDER_NAME = "2794270450"
+
+# Faction -> (folder under Buildings/Space/Skirmish, frigate yard, capital yard, research facility, star base prefix)
+FACTION_BUILDINGS = {
+    "Republic": ("Republic", "Republic_Frigate_Shipyard", "Republic_Capital_Shipyard", "Republic_Research_Facility", "Skirmish_Republic_Star_Base"),
+    "Empire": ("Empire", "E_Frigate_Shipyard", "E_Capital_Shipyard", "Empire_Research_Facility", "Skirmish_Empire_Star_Base"),
+    "Rebellion": ("Rebel", "R_Frigate_Shipyard", "R_Capital_Shipyard", "Rebel_Research_Facility", "Skirmish_Rebel_Star_Base"),
+    "CIS": ("CIS", "CIS_Frigate_Shipyard", "CIS_Capital_Shipyard", "CIS_Research_Facility", "Skirmish_CIS_Star_Base"),
+}
+
+# Unit file families: (filename prefix, affiliations drawn for its blocks, block tags)
+UNIT_FILES = [
+    ("Units_Space_Neutral_", ["Neutral", "Neutral, Underworld"], ["SpaceUnit", "SpaceUnit", "Squadron"]),
+    ("Units_Hero_Underworld_", ["Underworld"], ["HeroUnit", "UniqueUnit"]),
+    ("Units_Squadron_Underworld_", ["Underworld", "Neutral"], ["Squadron"]),
+    ("Units_Hero_Neutral_", ["Neutral"], ["HeroUnit"]),
+    ("Units_Space_Republic_", ["Republic"], ["SpaceUnit", "Squadron"]),
+    ("Units_Space_Empire_", ["Empire"], ["SpaceUnit", "Squadron"]),
+    ("Units_Space_Rebel_", ["Rebel"], ["SpaceUnit", "Squadron"]),
+    ("Units_Space_CIS_", ["CIS", "Confederacy"], ["SpaceUnit", "Squadron"]),
+    ("Units_Space_Hapan_", ["Hapes_Consortium", "Neutral"], ["SpaceUnit"]),
+    ("Units_Space_Old_Republic_", ["Neutral", "Republic"], ["SpaceUnit"]),
+]
+NAME_PREFIXES = ["", "", "U_", "Hapan_", "CSA_", "Rep_", "E_", "R_", "CIS_", "Pirate_", "Old_Republic_", "Mand_", "Nebula_"]
+NAME_STEMS = ["Star", "Light", "Heavy", "Assault", "Carrack", "Venator", "Nebulon", "Corona", "Dragon", "Battle", "Marauder", "Kaloth"]
+NAME_KINDS = ["Cruiser", "Frigate", "Destroyer", "Wing", "Carrier", "Gunship", "Corvette", "Interceptor"]
+NAME_SUFFIXES = ["", "", "", "_Mk2", "_Squadron", "_Garrison", "_DUMMY", "_Crate", "_Elite", "_Cost"]
+CATEGORIES = ["Frigate", "Capital", "Corvette | Frigate", "Fighter", "Bomber | Fighter", "Cruiser", "Dreadnought | Capital", "SuperCapital"]
+BUILD_TAGS = [
+    ("Required_Special_Structures", "Some_Shipyard"), ("Required_Planets", "Coruscant"),
+    ("Required_Orbiting_Units", "Orbital_Dummy"), ("Tactical_Build_Prerequisites", "Tech_2"),
+    ("Required_Star_Base_Level", " 3 "), ("Tech_Level", "2"),
+    ("Build_Tab_Space_Units", "No"), ("Build_Initially_Locked", "Yes"),
+    ("Build_Time_Seconds", "45"), ("Tactical_Build_Time_Seconds", "30"),
+    ("Population_Value", "4"), ("Build_Limit_Current_Per_Player", "2"),
+    ("Build_Limit_Lifetime_Per_Player", "1"), ("Build_Max_Instances_Per_Planet", "3"),
+    ("Build_Cost_Credits", "1500"), ("Tactical_Build_Cost_Multiplayer", "1200"),
+]
+
+
+def unit_block(rng, name, tag, affiliation):
+    lines = [f'\t<{tag} Name="{name}">']
+    if rng.random() < 0.9:
+        lines.append(f'\t\t<Affiliation>{affiliation}</Affiliation>')
+    lines.append(f'\t\t<CategoryMask>{rng.choice(CATEGORIES)}</CategoryMask>')
+    if rng.random() < 0.3:
+        lines.append(f'\t\t<Variant_Of_Existing_Type>{name}_Base</Variant_Of_Existing_Type>')
+    for build_tag, value in BUILD_TAGS:
+        if rng.random() < 0.55:
+            lines.append(f'\t\t<{build_tag}>{value}</{build_tag}>')
+    if rng.random() < 0.2:
+        lines.append('\t\t<!-- designer note <Tech_Level>9</Tech_Level> -->')
+    # Remake units carry dozens of art/combat tags the tool never touches
+    for i in range(rng.randint(10, 60)):
+        lines.append(f'\t\t<Filler_Tag_{i}>{rng.random():.6f}, {rng.random():.6f}</Filler_Tag_{i}>')
+    lines.append(f'\t</{tag}>')
+    return "\n".join(lines)
+
+
+def xml_file(root_tag, blocks):
+    return f'<?xml version="1.0"?>\n<{root_tag}>\n' + "\n\n".join(blocks) + f"\n</{root_tag}>\n"
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write(text)
+
+
+def generate(root_dir, files=500, blocks_per_file=12, seed=1):
+    """Writes the tree under root_dir and returns its Data/Xml path."""
+    rng = random.Random(seed)
+    xml_dir = os.path.join(root_dir, MOD_FOLDER_NAME, "Data", "Xml")
+    used_names = set()
+
+    def unit_name():
+        while True:
+            name = (f"{rng.choice(NAME_PREFIXES)}{rng.choice(NAME_STEMS)}_{rng.choice(NAME_KINDS)}"
+                    f"{rng.randint(0, 9999)}{rng.choice(NAME_SUFFIXES)}")
+            if name not in used_names:
+                used_names.add(name)
+                return name
+
+    for i in range(files):
+        prefix, affiliations, tags = rng.choice(UNIT_FILES)
+        blocks = [unit_block(rng, unit_name(), rng.choice(tags), rng.choice(affiliations))
+                  for _ in range(rng.randint(1, blocks_per_file))]
+        write(os.path.join(xml_dir, "Units", "Space", f"{prefix}{i}.xml"), xml_file("Units", blocks))
+
+    # Folders the tool must skip, and ground units it leaves alone
+    for i in range(max(1, files // 10)):
+        blocks = [unit_block(rng, unit_name(), "GroundCompany", rng.choice(["Neutral", "Empire"])) for _ in range(3)]
+        write(os.path.join(xml_dir, "Units", "Ground", f"Units_Ground_{i}.xml"), xml_file("Units", blocks))
+        write(os.path.join(xml_dir, "Units", "Space", "Story", f"Story_Units_{i}.xml"), xml_file("Units", blocks))
+        write(os.path.join(xml_dir, "Units", "Space", "Campaign", f"Campaign_Units_{i}.xml"), xml_file("Units", blocks))
+
+    # Files apply_fixes() repairs, in their broken upstream form
+    write(os.path.join(xml_dir, "Upgrades", "Vanilla.xml"),
+          '   <?xml version="1.0"?>\n<Upgrades>\n<UpgradeObject Name="Vanilla_Up">\n<Tech_Level>2</Tech_Level>\n</UpgradeObject>\n</Upgrades>\n')
+    write(os.path.join(xml_dir, "Upgrades", "Skirmish", "Space", "Republic", "Mines_Defense.xml"),
+          '\n  <?xml version="1.0"?>\n<Upgrades></Upgrades>\n')
+    write(os.path.join(xml_dir, "Units", "Space", "Units_Hero_Empire_181st_Fighter_Wing.XML"),
+          '<?xml version="1.0"?>\n<Units>\n<181st>x</181st>\n' + unit_block(rng, "TIE_181st", "Squadron", "Empire") + '\n</Units>\n')
+    write(os.path.join(xml_dir, "Units", "Space", "Units_Hero_Minors_CSA_Tagge.XML"),
+          '<80s_Visor_Man>\n<HeroUnit Name="Tagge_Hero">\n<Affiliation>Neutral</Affiliation>\n</HeroUnit>\n</80s_Visor_Man>\n')
+
+    for folder, frigate_yard, capital_yard, research, star_base in FACTION_BUILDINGS.values():
+        def roster(count):
+            return ",\n\t\t\t\t".join(f"{folder}_Unit_{k}" for k in range(count))
+
+        def building(tag, name, count, extra=""):
+            return (f'\t<{tag} Name="{name}">\n\t\t<Affiliation>{folder}</Affiliation>\n{extra}'
+                    f'\t\t<Tactical_Buildable_Objects_Multiplayer>\n\t\t\t\t{roster(count)}\n'
+                    f'\t\t\t</Tactical_Buildable_Objects_Multiplayer>\n\t</{tag}>')
+
+        base = os.path.join(xml_dir, "Buildings", "Space", "Skirmish", folder)
+        write(os.path.join(base, "Shipyards.xml"),
+              xml_file("Buildings", [building("SpaceBuildable", frigate_yard, 8), building("SpaceBuildable", capital_yard, 5)]))
+        write(os.path.join(base, "Starbases.xml"),
+              xml_file("Buildings", [building("StarBase", f"{star_base}_{level}", level,
+                                              f"\t\t<Base_Income_Value>{10 * level}.5</Base_Income_Value>\n")
+                                     for level in range(1, 6)]))
+        write(os.path.join(base, "Research_Facilities.xml"), xml_file("Buildings", [building("SpaceBuildable", research, 3)]))
+        write(os.path.join(xml_dir, "Upgrades", "Skirmish", "Space", folder, "Upgrades.xml"),
+              xml_file("Upgrades", [unit_block(rng, f"{folder}_Shield_Upgrade", "UpgradeObject", folder)]))
+        write(os.path.join(xml_dir, "Research", f"Research_{folder}.xml"),
+              xml_file("Research", [unit_block(rng, f"{folder}_Research_Tier", "UpgradeObject", folder),
+                                    unit_block(rng, f"Tech_{folder}_Probe", "SpaceUnit", folder)]))
+    return xml_dir
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic Remake-shaped Data/Xml tree")
+    parser.add_argument("out_dir", help="Folder that receives the 2794270450 mod folder")
+    parser.add_argument("--files", type=int, default=500, help="Unit files under Units/Space (default: 500)")
+    parser.add_argument("--blocks", type=int, default=12, help="Maximum unit blocks per file (default: 12)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    print(f"Generated {generate(args.out_dir, args.files, args.blocks, args.seed)}")
+
+
+if __name__ == "__main__":
+    main()
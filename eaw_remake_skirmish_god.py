@@ -1,10 +1,20 @@
 
 import os
 import re
+import json
+import hashlib
+import codecs
 import shutil
-import subprocess
 import xml.etree.ElementTree as ET
 import sys
+import mmap
+import argparse
+import collections
+import functools
+import contextlib
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 # ============================================================
 # DEBUG MODE: Set to True to see detailed unit conversion logs
@@ -24,30 +34,50 @@ if not os.path.exists(WORKING_DIR):
     SCRIPT_DIR = os.path.dirname(WORKING_DIR)
 
 # Dynamically find or create backup directory
-def find_or_create_backup():
+def find_or_create_backup(quiet=False):
     """Search for existing backup folder (- copy or - copie) or create one."""
     parent_dir = SCRIPT_DIR
     
     # Search for existing backups
-    for item in os.listdir(parent_dir):
+    for item in (os.listdir(parent_dir) if os.path.isdir(parent_dir) else []):
         item_path = os.path.join(parent_dir, item)
         if os.path.isdir(item_path):
             # Check if it matches pattern: "2794270450 - copy" or "2794270450 - copie"
             if item.lower().startswith(MOD_FOLDER_NAME.lower()):
                 if " - copy" in item.lower() or " - copie" in item.lower():
-                    print(f"Found existing backup: {item}")
+                    if not quiet: print(f"Found existing backup: {item}")
                     return item_path
     
     # No backup found, create default one
     backup_name = f"{MOD_FOLDER_NAME} - copy"
     backup_path = os.path.join(parent_dir, backup_name)
-    print(f"No backup found. Will create: {backup_name}")
+    if not quiet: print(f"No backup found. Will create: {backup_name}")
     return backup_path
 
-BACKUP_DIR = find_or_create_backup()
+# Stay quiet when imported (e.g. by --jobs worker processes re-importing this script)
+BACKUP_DIR = find_or_create_backup(quiet=__name__ != "__main__")
 
 XML_DIR = os.path.join(WORKING_DIR, "Data", "Xml")
 
+# Folders under Data/Xml that hold the units, buildings and upgrades the tool rewrites
+TARGET_DIRS = ["Units", "Buildings", "Research", "Upgrades"]
+
+# Delta restore: manifest of the clean backup (path, size, mtime, content hash)
+# is kept inside the backup folder so deleting the backup also drops the manifest
+MANIFEST_NAME = "_skirmish_god_manifest.json"
+RESTORE_WORKERS = 8
+
+# Backup creation: reflink (copy-on-write clone) where the filesystem supports it,
+# otherwise hard links for everything outside Data/Xml (textures, models, audio are
+# never written) and real copies of the XML the tool rewrites
+FICLONE = 0x40049409  # Linux ioctl: clone a whole file (Btrfs, XFS, bcachefs, ...)
+_reflink_supported = None
+
+# Overlay mode: changed files are staged next to the mod, then swapped in; the journal
+# lists the swapped files so the next run (or --undo) only has to put those back
+STAGING_NAME = "_skirmish_god_staging"
+OVERLAY_JOURNAL_NAME = "_skirmish_god_overlay.json"
+
 # Faction Mapping
 FACTIONS = {
     "1": ("Republic", r"Republic"),
@@ -56,11 +86,264 @@ FACTIONS = {
     "4": ("Empire", r"Empire")
 }
 
+# Skirmish build locations per faction: folder under Buildings/Space/Skirmish (holding
+# Shipyards.xml, Starbases.xml and Research_Facilities.xml) and the buildable names
+SKIRMISH_BUILDINGS = {
+    "Republic": {"folder": "Republic", "frigate_name": "Republic_Frigate_Shipyard",
+                 "capital_name": "Republic_Capital_Shipyard", "research_name": "Republic_Research_Facility"},
+    "Empire": {"folder": "Empire", "frigate_name": "E_Frigate_Shipyard",
+               "capital_name": "E_Capital_Shipyard", "research_name": "Empire_Research_Facility"},
+    "Rebellion": {"folder": "Rebel", "frigate_name": "R_Frigate_Shipyard",
+                  "capital_name": "R_Capital_Shipyard", "research_name": "Rebel_Research_Facility"},
+    "CIS": {"folder": "CIS", "frigate_name": "CIS_Frigate_Shipyard",
+            "capital_name": "CIS_Capital_Shipyard", "research_name": "CIS_Research_Facility"},
+}
+
 def print_header(msg):
     print(f"\n{'='*60}")
     print(f" {msg}")
     print(f"{'='*60}")
 
+# --- PROFILER ---
+# --profile: wall/CPU time and peak traced memory per step, per-file rewrite timings,
+# block counts and regex call counts. PROFILER stays None (and costs nothing) otherwise.
+PROFILER = None
+PROFILE_TOP = 10
+REGEX_COUNTS = collections.Counter()  # "PATTERN.method" -> calls, in this process
+
+class CountingPattern:
+    """Compiled-pattern stand-in that counts every search/sub/... call into REGEX_COUNTS."""
+
+    def __init__(self, label, pattern):
+        self._label = label
+        self._pattern = pattern
+
+    def __getattr__(self, name):
+        attr = getattr(self._pattern, name)
+        if name not in ("search", "match", "fullmatch", "sub", "subn", "finditer", "findall", "split"):
+            return attr
+        key = f"{self._label}.{name}"
+        def counted(*args, **kwargs):
+            REGEX_COUNTS[key] += 1
+            return attr(*args, **kwargs)
+        return counted
+
+def instrument_patterns():
+    """Swaps the module's hot patterns (and pattern factories) for counting wrappers."""
+    module = sys.modules[__name__]
+    for name, value in list(vars(module).items()):
+        if name.endswith("_PATTERN") and isinstance(value, re.Pattern):
+            setattr(module, name, CountingPattern(name, value))
+    for name in ("tag_scanner", "closing_tag_pattern", "faction_affiliation_pattern", "other_faction_file_pattern"):
+        factory = getattr(module, name)
+        if getattr(factory, "counted", False):
+            continue
+        def counted_factory(*args, _factory=factory, _label=name, **kwargs):
+            pattern = _factory(*args, **kwargs)
+            return pattern if pattern is None else CountingPattern(_label, pattern)
+        counted_factory.counted = True
+        setattr(module, name, counted_factory)
+
+class Profiler:
+    """Collects the --profile measurements and writes the JSON report."""
+
+    def __init__(self):
+        self.stages = []
+        self.files = []
+        self.worker_regex = collections.Counter()  # Counts returned by --jobs workers
+        self._open = []
+        tracemalloc.start()
+        instrument_patterns()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        record = {"stage": name, "inside": self._open[-1]["stage"] if self._open else None}
+        self._open.append(record)
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()  # Python 3.9+; older versions report the peak so far
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            record["wall_s"] = round(time.perf_counter() - wall, 4)
+            record["cpu_s"] = round(time.process_time() - cpu, 4)
+            record["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / (1 << 20), 2)
+            self._open.pop()
+            self.stages.append(record)
+
+    def add_file(self, rel_path, info, from_worker=False):
+        regex = info.pop("regex", {})
+        if from_worker:
+            self.worker_regex.update(regex)
+        info["regex_calls"] = sum(regex.values())
+        self.files.append(dict(info, file=rel_path))
+
+    def report(self, path, **meta):
+        regex = REGEX_COUNTS + self.worker_regex
+        report = dict(meta,
+                      stages=self.stages,
+                      files=sorted(self.files, key=lambda entry: entry["seconds"], reverse=True),
+                      regex=dict(regex.most_common()))
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=1)
+
+        print_header(f"Profile: {PROFILE_TOP} Slowest Files")
+        print(f"{'seconds':>9} {'KB':>8} {'blocks':>7} {'regex':>7}  file")
+        for entry in report["files"][:PROFILE_TOP]:
+            print(f"{entry['seconds']:>9.4f} {entry['bytes'] / 1024:>8.1f} {entry['blocks']:>7} {entry['regex_calls']:>7}  {entry['file']}")
+        print(f"\n{'stage':<12} {'wall s':>8} {'cpu s':>8} {'peak MB':>8}")
+        for record in self.stages:
+            label = record["stage"] if record["inside"] is None else f" {record['stage']}"
+            print(f"{label:<12} {record['wall_s']:>8.3f} {record['cpu_s']:>8.3f} {record['peak_mb']:>8.2f}")
+        print(f"\nProfile written to: {path}")
+
+def profile_stage(name):
+    """PROFILER.stage(name), or a no-op when not profiling."""
+    return PROFILER.stage(name) if PROFILER is not None else contextlib.nullcontext()
+
+# --- DELTA RESTORE ENGINE ---
+def hash_file(path):
+    """SHA-1 of a file's content, read in 1 MB chunks."""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def walk_tree(root_dir, skip_names=()):
+    """
+    Lists every file and directory under root_dir.
+    Returns: ({rel_path: os.stat_result}, set of rel dir paths) with '/' separators.
+    """
+    files = {}
+    dirs = set()
+    for root, dirnames, filenames in os.walk(root_dir):
+        rel_root = os.path.relpath(root, root_dir).replace(os.sep, '/')
+        prefix = "" if rel_root == "." else rel_root + "/"
+        for d in dirnames:
+            dirs.add(prefix + d)
+        for name in filenames:
+            if name in skip_names: continue
+            files[prefix + name] = os.stat(os.path.join(root, name))
+    return files, dirs
+
+def load_backup_manifest(backup_dir):
+    """
+    Loads the backup manifest and refreshes it against the backup folder.
+    Entries whose size/mtime still match keep their cached hash; hashes are
+    computed lazily, only when a restore actually needs to compare content.
+    Returns: {"files": {rel_path: [size, mtime_ns, hash or None]}, "dirs": [...]}
+    """
+    manifest_path = os.path.join(backup_dir, MANIFEST_NAME)
+    cached = {}
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            cached = json.load(f).get("files", {})
+    except (OSError, ValueError):
+        pass
+
+    files, dirs = walk_tree(backup_dir, skip_names=(MANIFEST_NAME, CATALOG_NAME, VALIDATION_NAME, DIR_INDEX_NAME, SYMBOL_CACHE_NAME))
+    entries = {}
+    for rel_path, st in files.items():
+        old = cached.get(rel_path)
+        if old and old[0] == st.st_size and old[1] == st.st_mtime_ns:
+            entries[rel_path] = old
+        else:
+            entries[rel_path] = [st.st_size, st.st_mtime_ns, None]
+    return {"files": entries, "dirs": sorted(dirs)}
+
+def save_backup_manifest(backup_dir, manifest):
+    manifest_path = os.path.join(backup_dir, MANIFEST_NAME)
+    tmp_path = manifest_path + ".tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, separators=(',', ':'))
+        os.replace(tmp_path, manifest_path)
+    except OSError as e:
+        print(f"Warning: Could not save backup manifest: {e}")
+
+def reflink_file(src, dst):
+    """Clones src to dst sharing its data blocks. Returns False if the filesystem can't."""
+    global _reflink_supported
+    if _reflink_supported is False:
+        return False
+    try:
+        import fcntl
+    except ImportError:
+        _reflink_supported = False
+        return False
+    try:
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    except OSError:
+        if os.path.exists(dst):
+            os.remove(dst)
+        _reflink_supported = False
+        return False
+    shutil.copystat(src, dst)
+    _reflink_supported = True
+    return True
+
+def clone_file(src, dst, allow_link=False):
+    """
+    Copies src to dst as cheaply as possible: reflink, then (if allowed) hard link,
+    then a real copy. Returns "reflink", "link" or "copy".
+    """
+    if reflink_file(src, dst):
+        return "reflink"
+    if allow_link:
+        try:
+            os.link(src, dst)
+            return "link"
+        except OSError:
+            pass  # Cross-device, FAT/exFAT, ...
+    shutil.copy2(src, dst)
+    return "copy"
+
+def create_backup(source_dir, backup_dir):
+    """Builds the backup folder with clone_file(); only Data/Xml is ever really copied."""
+    xml_rel = os.path.join("Data", "Xml")
+    counts = collections.Counter()
+    copied_bytes = 0
+    for root, dirnames, filenames in os.walk(source_dir):
+        rel_root = os.path.relpath(root, source_dir)
+        os.makedirs(os.path.join(backup_dir, rel_root), exist_ok=True)
+        in_xml = rel_root == xml_rel or rel_root.startswith(xml_rel + os.sep)
+        for name in filenames:
+            src = os.path.join(root, name)
+            method = clone_file(src, os.path.join(backup_dir, rel_root, name), allow_link=not in_xml)
+            counts[method] += 1
+            if method == "copy":
+                copied_bytes += os.path.getsize(src)
+    print(f"Backup: {counts['reflink']} reflinked, {counts['link']} hard-linked, "
+          f"{counts['copy']} copied ({copied_bytes / (1 << 20):.1f} MB of real copies).")
+
+def restore_file_if_changed(rel_path, entry, working_st):
+    """
+    Copies one file from the backup if the working copy differs.
+    Size mismatch -> copy. Same size and mtime -> unchanged (copy2 preserves mtime).
+    Same size, different mtime -> compare content hashes.
+    Returns: (rel_path, copied, backup_hash)
+    """
+    src = os.path.join(BACKUP_DIR, *rel_path.split('/'))
+    dst = os.path.join(WORKING_DIR, *rel_path.split('/'))
+    size, mtime_ns, backup_hash = entry
+
+    if working_st is not None and working_st.st_size == size:
+        if working_st.st_mtime_ns == mtime_ns:
+            return rel_path, False, backup_hash
+        if backup_hash is None:
+            backup_hash = hash_file(src)
+        if hash_file(dst) == backup_hash:
+            return rel_path, False, backup_hash
+
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    if working_st is not None:
+        os.remove(dst)  # Never write through a hard link shared with the backup
+    clone_file(src, dst)
+    return rel_path, True, backup_hash
+
 def restore_backup():
     print_header("Step 1: Restoring from Clean Backup")
     print(f"Using backup: {BACKUP_DIR}")
@@ -69,7 +352,8 @@ def restore_backup():
         print(f"Backup does not exist yet. Creating initial backup from current state...")
         print(f"Copying {WORKING_DIR} -> {BACKUP_DIR}...")
         try:
-            shutil.copytree(WORKING_DIR, BACKUP_DIR)
+            create_backup(WORKING_DIR, BACKUP_DIR)
+            save_backup_manifest(BACKUP_DIR, load_backup_manifest(BACKUP_DIR))
             print("Initial backup created successfully!")
             print("NOTE: This backup will be used for all future restores.")
             print("      To refresh the backup, delete it and run the script again.")
@@ -78,44 +362,488 @@ def restore_backup():
             print(f"ERROR: Failed to create backup: {e}")
             sys.exit(1)
         
-    print(f"Mirroring {BACKUP_DIR} -> {WORKING_DIR}...")
-    cmd = ['robocopy', BACKUP_DIR, WORKING_DIR, '/MIR', '/NFL', '/NDL', '/NJH', '/NJS', '/NC', '/NS', '/NP']
-    result = subprocess.run(cmd, shell=True)
-    
-    if result.returncode > 7:
-        print(f"CRITICAL ERROR: Robocopy failed with code {result.returncode}")
+    print(f"Delta restore {BACKUP_DIR} -> {WORKING_DIR}...")
+    try:
+        manifest = load_backup_manifest(BACKUP_DIR)
+        working_files, working_dirs = walk_tree(WORKING_DIR)
+        backup_files = manifest["files"]
+
+        copied = 0
+        with ThreadPoolExecutor(max_workers=RESTORE_WORKERS) as pool:
+            futures = [pool.submit(restore_file_if_changed, rel_path, entry, working_files.get(rel_path))
+                       for rel_path, entry in backup_files.items()]
+            for future in futures:
+                rel_path, was_copied, backup_hash = future.result()
+                backup_files[rel_path][2] = backup_hash
+                copied += was_copied
+
+        # Mirror semantics: drop files and folders that are not in the backup
+        removed = 0
+        for rel_path in working_files:
+            if rel_path not in backup_files:
+                os.remove(os.path.join(WORKING_DIR, *rel_path.split('/')))
+                removed += 1
+        backup_dirs = set(manifest["dirs"])
+        for rel_dir in sorted(working_dirs - backup_dirs, key=len, reverse=True):
+            shutil.rmtree(os.path.join(WORKING_DIR, *rel_dir.split('/')), ignore_errors=True)
+        for rel_dir in backup_dirs - working_dirs:
+            os.makedirs(os.path.join(WORKING_DIR, *rel_dir.split('/')), exist_ok=True)
+
+        save_backup_manifest(BACKUP_DIR, manifest)
+        clear_overlay_journal()  # The whole tree is clean again
+        forget_tree_index(XML_DIR)
+    except Exception as e:
+        print(f"CRITICAL ERROR: Restore failed: {e}")
         sys.exit(1)
-    print("Restore completed.")
 
-def apply_fixes():
+    print(f"Restore completed. {copied} file(s) restored, {removed} extra file(s) removed, {len(backup_files) - copied} unchanged.")
+
+# --- OVERLAY JOURNAL ---
+def overlay_journal_path():
+    return os.path.join(SCRIPT_DIR, OVERLAY_JOURNAL_NAME)
+
+def load_overlay_journal():
+    """Returns {"state": "swapping"|"applied", "faction", "files": [rel paths]} or None."""
+    try:
+        with open(overlay_journal_path(), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def save_overlay_journal(journal):
+    """Written to a temp file and renamed, so the journal itself is never half-written."""
+    tmp_path = overlay_journal_path() + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(journal, f, indent=1)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, overlay_journal_path())
+
+def clear_overlay_journal():
+    if os.path.exists(overlay_journal_path()):
+        os.remove(overlay_journal_path())
+
+def rollback_overlay(journal):
+    """Puts the journaled files back from the backup (or removes them). Returns the count."""
+    backup_xml_dir = os.path.join(BACKUP_DIR, "Data", "Xml")
+    restored = 0
+    for rel_path in journal.get("files", []):
+        live_path = os.path.join(XML_DIR, *rel_path.split('/'))
+        backup_path = os.path.join(backup_xml_dir, *rel_path.split('/'))
+        if os.path.exists(backup_path):
+            tmp_path = live_path + ".skirmish_god.tmp"
+            clone_file(backup_path, tmp_path)
+            os.replace(tmp_path, live_path)
+        elif os.path.exists(live_path):
+            os.remove(live_path)
+        restored += 1
+    clear_overlay_journal()
+    return restored
+
+# --- XML ENCODINGS ---
+# Files are read as bytes and their encoding is taken from the byte order mark or the
+# XML declaration (UTF-8 when neither says otherwise). Undeclared files that aren't
+# valid UTF-8 fall back to cp1252, the usual encoding of Windows-edited XML. Changed
+# documents are written back in the encoding (and with the BOM) they were read in.
+XML_BOMS = ((codecs.BOM_UTF8, 'utf-8'), (codecs.BOM_UTF16_LE, 'utf-16-le'), (codecs.BOM_UTF16_BE, 'utf-16-be'))
+XML_ENCODING_DECLARATION = re.compile(rb'\s*<\?xml[^>]*?\bencoding\s*=\s*["\']([A-Za-z0-9._-]+)["\']')
+FALLBACK_ENCODINGS = ('cp1252', 'latin-1')
+DEFAULT_ENCODING = ('utf-8', b'')
+
+def is_ascii_compatible(codec):
+    """True if markup bytes (<, >, tag names) are plain ASCII in codec, so byte patterns work."""
+    return not codec.startswith(('utf-16', 'utf-32'))
+
+def detect_xml_encoding(data):
+    """(codec, bom) of raw XML: byte order mark first, then the XML declaration, else UTF-8."""
+    head = bytes(data[:256])
+    for bom, codec in XML_BOMS:
+        if head.startswith(bom):
+            return codec, bom
+    if head.startswith(b'<\0'):
+        return 'utf-16-le', b''
+    if head.startswith(b'\0<'):
+        return 'utf-16-be', b''
+    match = XML_ENCODING_DECLARATION.match(head)
+    if match:
+        try:
+            codec = codecs.lookup(match.group(1).decode('ascii')).name
+        except LookupError:
+            return DEFAULT_ENCODING
+        if is_ascii_compatible(codec):  # A readable declaration can't be in UTF-16 bytes
+            return codec, b''
+    return DEFAULT_ENCODING
+
+def decode_xml(data):
+    """(text, (codec, bom)) of raw XML bytes."""
+    codec, bom = detect_xml_encoding(data)
+    body = bytes(data[len(bom):])
+    try:
+        return body.decode(codec), (codec, bom)
+    except UnicodeDecodeError:
+        if not is_ascii_compatible(codec):
+            raise
+    for fallback in FALLBACK_ENCODINGS:
+        try:
+            return body.decode(fallback), (fallback, bom)
+        except UnicodeDecodeError:
+            continue
+
+def encode_xml(text, encoding):
+    codec, bom = encoding
+    return bom + text.encode(codec)
+
+def scannable_bytes(data):
+    """The document as UTF-8 bytes (data itself if it already is), so matched names decode as UTF-8."""
+    if data.isascii():
+        return data
+    text, (codec, _) = decode_xml(data)
+    return data if codec == 'utf-8' else text.encode('utf-8')
+
+# --- WRITE LAYER ---
+# Every step writes through write_files(): byte-identical files are left alone (their
+# mtimes stay valid for change detection), new content goes to a temp file that replaces
+# the target with os.replace(), so a crash never leaves a truncated XML behind. Temp files
+# are written in parallel and made durable with a single sync before the renames.
+WRITE_WORKERS = 8
+
+def same_content(path, data):
+    """True if the file at path already holds exactly data."""
+    try:
+        if os.path.getsize(path) != len(data):
+            return False
+        with open(path, 'rb') as f:
+            return f.read() == data
+    except OSError:
+        return False
+
+def write_temp_file(path, data, fsync):
+    """Writes data next to path. Returns: the temp path, or None if it could not be written."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        return tmp_path
+    except OSError as e:
+        print(f"Error writing {path}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+
+def write_files(items):
+    """
+    Writes (path, bytes) items atomically, skipping files that already hold the bytes.
+    Returns: (written paths, unchanged paths, bytes written), in the order of items.
+    """
+    items = [(path, data) for path, data in items]
+    with ThreadPoolExecutor(max_workers=WRITE_WORKERS) as pool:
+        unchanged_flags = list(pool.map(lambda item: same_content(*item), items))
+        pending = [item for item, unchanged in zip(items, unchanged_flags) if not unchanged]
+        # os.sync() flushes every temp file at once; without it (Windows) each one is fsynced
+        single_sync = hasattr(os, "sync")
+        tmp_paths = list(pool.map(lambda item: write_temp_file(item[0], item[1], not single_sync), pending))
+    if single_sync and pending:
+        os.sync()
+
+    written, bytes_written = [], 0
+    for (path, data), tmp_path in zip(pending, tmp_paths):
+        if tmp_path is None:
+            continue
+        try:
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Error writing {path}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            continue
+        written.append(path)
+        bytes_written += len(data)
+    unchanged = [path for (path, _), flag in zip(items, unchanged_flags) if flag]
+    return written, unchanged, bytes_written
+
+def report_writes(written, unchanged, bytes_written):
+    print(f"Wrote {len(written)} changed file(s) ({bytes_written:,} bytes); {len(unchanged)} already up to date.")
+
+# --- DOCUMENT STORE ---
+class XmlDocumentStore:
+    """
+    View of Data/Xml shared by the pipeline steps.
+    Paths are always given under XML_DIR; reads come from `source_dir` (the live
+    folder, or the backup's Data/Xml for --plan) and each file is read at most once.
+    With write_through=False nothing touches disk: changed content stays in `changes`,
+    later reads see it, and flush() writes every changed file once at the end.
+    A write-through store writes each step's files in one batch when the step calls end_step().
+    A store layered on a `base` store reads the base's documents (and reuses its
+    parsed blocks) for every path it hasn't changed itself.
+    """
+
+    def __init__(self, source_dir=None, write_through=True, base=None):
+        self.xml_dir = XML_DIR
+        self.source_dir = base.source_dir if base is not None else (source_dir or XML_DIR)
+        self.write_through = write_through
+        self.base = base
+        self.changes = {}  # path -> new content (str or bytes), in write order
+        self.documents = {}  # path -> source text already read (never the changed text)
+        self.encodings = {}  # path -> (codec, bom) the document was read in
+        self.notes = collections.defaultdict(list)  # path -> edit records for --plan
+        self.parsed = {}  # path -> (raw bytes, catalog block records or None)
+        self.definitions = {}  # rel path -> definition records of the source file, from whichever step read it
+        self.symbols = None  # (definitions of the whole source tree, SymbolTable), scanned once per run
+        self.saved_definitions = None  # rel paths whose definitions came from the previous run's symbol cache
+        self.unflushed = {}  # Write-through paths changed since the last flush, in write order
+
+    def source_store(self):
+        """The bottom store of the layers; it holds what is known about the source tree."""
+        store = self
+        while store.base is not None:
+            store = store.base
+        return store
+
+    def source_path(self, path):
+        if self.source_dir == self.xml_dir:
+            return path
+        return os.path.join(self.source_dir, os.path.relpath(path, self.xml_dir))
+
+    def rel_path(self, path):
+        return os.path.relpath(path, self.xml_dir).replace(os.sep, '/')
+
+    def target_files(self, target_dirs):
+        """collect_target_files() over the source folder, returned as paths under XML_DIR."""
+        return [os.path.join(self.xml_dir, os.path.relpath(fp, self.source_dir))
+                for fp in collect_target_files(target_dirs, self.source_dir)]
+
+    def changed_paths(self):
+        """Paths this store or its base rewrote, in write order."""
+        base_changes = list(self.base.changes) if self.base is not None else []
+        return list(dict.fromkeys(base_changes + list(self.changes)))
+
+    def is_pending(self, path):
+        """True if the document only exists in memory (changed, not written through)."""
+        return not self.write_through and path in self.changes
+
+    def in_memory(self, path):
+        """True if read() can answer without touching disk."""
+        return path in self.changes or path in self.documents
+
+    def exists(self, path):
+        if self.is_pending(path):
+            return True
+        if self.base is not None:
+            return self.base.exists(path)
+        return os.path.exists(self.source_path(path))
+
+    def read(self, path):
+        if path in self.changes:  # Pending, or written through (disk holds the same text)
+            content = self.changes[path]
+            if isinstance(content, bytes):
+                content, self.encodings[path] = decode_xml(content)
+            return content
+        if self.base is not None:
+            return self.base.read(path)
+        return self.read_source(path)
+
+    def read_source(self, path):
+        """Text of the unmodified source file ("" if it doesn't exist), read and decoded once."""
+        if self.base is not None:
+            return self.base.read_source(path)
+        if path not in self.documents:
+            if path in self.parsed and not self.is_pending(path):
+                self.keep_source(path, self.parsed[path][0])  # Raw bytes already read by tokens()
+            elif not os.path.exists(self.source_path(path)):
+                return ""
+            else:
+                with open(self.source_path(path), 'rb') as f: self.keep_source(path, f.read())
+        return self.documents[path]
+
+    def keep_source(self, path, data):
+        """Records the raw source bytes a step read itself, so read_source() needn't open the file again."""
+        if path not in self.documents:
+            self.documents[path], self.encodings[path] = decode_xml(data)
+
+    def encoding(self, path):
+        """(codec, bom) the document is written back in."""
+        if path in self.encodings:
+            return self.encodings[path]
+        if self.base is not None:
+            return self.base.encoding(path)
+        try:
+            with open(self.source_path(path), 'rb') as f:
+                return detect_xml_encoding(f.read(256))
+        except OSError:
+            return DEFAULT_ENCODING
+
+    def encoded(self, path):
+        """Raw bytes of the document's current content, in its own encoding."""
+        content = self.changes.get(path)
+        if content is None and self.base is not None:
+            content = self.base.changes.get(path)
+        if content is None:
+            content = self.read(path)
+        if isinstance(content, bytes):
+            return content
+        return encode_xml(content, self.encoding(path))
+
+    def tokens(self, path):
+        """(raw bytes, catalog block records or None if they can't be indexed) of the document, parsed once."""
+        if self.base is not None and not self.is_pending(path):
+            return self.base.tokens(path)
+        parsed = self.parsed.get(path)
+        if parsed is None:
+            if self.is_pending(path):
+                data = self.encoded(path)
+            else:
+                with open(self.source_path(path), 'rb') as f: data = f.read()
+            try:
+                blocks = catalog_file_blocks(data)
+            except UnicodeDecodeError:
+                blocks = None
+            parsed = self.parsed[path] = (data, blocks)
+        return parsed
+
+    def write(self, path, content):
+        if not self.write_through:
+            current = self.changes.get(path, self.documents.get(path))
+            if current is not None and current == content:
+                return  # Not dirty
+        elif not isinstance(content, bytes):
+            self.encodings.setdefault(path, self.encoding(path))  # Before the write replaces the source
+        self.changes[path] = content
+        self.parsed.pop(path, None)
+        if self.write_through:
+            self.unflushed[path] = None
+
+    def flush(self):
+        """
+        Writes every changed document to its path, once, through write_files()
+        (for a write-through store: those changed since the last flush).
+        Returns: (written paths, unchanged paths, bytes written)
+        """
+        if self.write_through:
+            paths, self.unflushed = list(self.unflushed), {}
+            return write_files((path, self.encoded(path)) for path in paths)
+        return write_files((path, self.encoded(path)) for path in self.changes)
+
+    def end_step(self):
+        """Called by each step when it is done; a write-through store writes (and syncs) the step's files."""
+        if self.write_through:
+            self.flush()
+
+    def note(self, path, record):
+        self.notes[path].append(record)
+
+# --- FIX REGISTRY ---
+# Upstream Remake bugs that break the XML parser live in skirmish_god_fixes.json next to
+# the script: one entry per fix with its file (relative to Data/Xml), a MULTILINE regex,
+# the replacement and the reason. A new upstream bug only needs a new entry there.
+FIX_REGISTRY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "skirmish_god_fixes.json")
+FIX_REGISTRIES = {}  # Registry path -> (mtime, compiled fixes), reused by watch and all-factions runs
+# Built-in copy of the shipped registry: used when skirmish_god_fixes.json is missing or
+# unreadable, because skipping these fixes leaves the game unable to load the XML
+DEFAULT_FIXES = [
+    {"file": "Upgrades/Vanilla.xml",
+     "pattern": r'^\s+<\?xml', "replacement": r'<?xml',
+     "reason": "Whitespace before the XML declaration"},
+    {"file": "Upgrades/Skirmish/Space/Republic/Mines_Defense.xml",
+     "pattern": r'^\s+<\?xml', "replacement": r'<?xml',
+     "reason": "Whitespace before the XML declaration"},
+    {"file": "Units/Space/Units_Space_First_Order_Supremacy.xml",
+     "pattern": r'</Reserve_Spaned_Units_Teh_0>', "replacement": r'</Reserve_Spawned_Units_Tech_0>',
+     "reason": "Misspelled closing tag"},
+    {"file": "Buildings/Ground/Skirmish_Rework/Mine.xml",
+     "pattern": r'(<Affiliation>CIS</Affiliation>)\s*(<GroundBuildable Name="Republic_Mineral_Processor">)', "replacement": r'\1\n\t</GroundBuildable>\n\n\t\2',
+     "reason": "Missing </GroundBuildable> before the Republic processor"},
+    {"file": "Units/Space/Units_Hero_Empire_181st_Fighter_Wing.XML",
+     "pattern": r'<181st>', "replacement": r'<_181st>',
+     "reason": "Tag names cannot start with a digit"},
+    {"file": "Units/Space/Units_Hero_Empire_181st_Fighter_Wing.XML",
+     "pattern": r'</181st>', "replacement": r'</_181st>',
+     "reason": "Tag names cannot start with a digit"},
+    {"file": "Units/Space/Units_Hero_Empire_181st_Fighter_Wing_BU.xml",
+     "pattern": r'<181st>', "replacement": r'<_181st>',
+     "reason": "Tag names cannot start with a digit"},
+    {"file": "Units/Space/Units_Hero_Empire_181st_Fighter_Wing_BU.xml",
+     "pattern": r'</181st>', "replacement": r'</_181st>',
+     "reason": "Tag names cannot start with a digit"},
+    {"file": "Units/Space/Units_Hero_Minors_CSA_Tagge.XML",
+     "pattern": r'(?:<\?xml version="1.0"\?>\s*|^)<80s_Visor_Man>', "replacement": r'<?xml version="1.0"?>\n<_80s_Visor_Man>',
+     "reason": "Root tag starts with a digit; adds the XML declaration if it is missing"},
+    {"file": "Units/Space/Units_Hero_Minors_CSA_Tagge.XML",
+     "pattern": r'</80s_Visor_Man>', "replacement": r'</_80s_Visor_Man>',
+     "reason": "Root tag starts with a digit"},
+]
+
+def compile_fixes(entries):
+    """{relative file: [(compiled pattern, replacement, entry), ...]} in registry order."""
+    fixes = {}
+    for entry in entries:
+        try:
+            pattern = re.compile(entry["pattern"], re.MULTILINE)
+            fixes.setdefault(entry["file"], []).append((pattern, entry["replacement"], entry))
+        except (KeyError, TypeError, re.error) as e:
+            print(f"WARNING: Skipping invalid fix {entry}: {e}")
+    return fixes
+
+def load_fix_registry(registry_path=None):
+    """
+    Loads and compiles the fix registry once, falling back to DEFAULT_FIXES if it can't be read.
+    Returns: {relative file: [(compiled pattern, replacement, entry), ...]} in registry order
+    """
+    registry_path = registry_path or FIX_REGISTRY_PATH
+    try:
+        mtime = os.path.getmtime(registry_path)
+    except OSError:
+        mtime = None
+    cached = FIX_REGISTRIES.get(registry_path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    entries = DEFAULT_FIXES
+    if mtime is None:
+        print(f"WARNING: Fix registry not found: {registry_path}. Using the built-in fixes.")
+    else:
+        try:
+            with open(registry_path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)["fixes"]
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Error reading fix registry {registry_path}: {e}. Using the built-in fixes.")
+            entries = DEFAULT_FIXES
+    fixes = compile_fixes(entries)
+    FIX_REGISTRIES[registry_path] = (mtime, fixes)
+    return fixes
+
+def apply_fixes(store=None):
     print_header("Step 2: Applying Critical XML Fixes")
-    
-    replacements = [
-        (os.path.join(XML_DIR, "Upgrades", "Vanilla.xml"), r'^\s+<\?xml', r'<?xml'),
-        (os.path.join(XML_DIR, "Upgrades", "Skirmish", "Space", "Republic", "Mines_Defense.xml"), r'^\s+<\?xml', r'<?xml'),
-        (os.path.join(XML_DIR, "Units", "Space", "Units_Space_First_Order_Supremacy.xml"), r'</Reserve_Spaned_Units_Teh_0>', r'</Reserve_Spawned_Units_Tech_0>'),
-        (os.path.join(XML_DIR, "Buildings", "Ground", "Skirmish_Rework", "Mine.xml"), r'(<Affiliation>CIS</Affiliation>)\s*(<GroundBuildable Name="Republic_Mineral_Processor">)', r'\1\n\t</GroundBuildable>\n\n\t\2'),
-        (os.path.join(XML_DIR, "Units", "Space", "Units_Hero_Empire_181st_Fighter_Wing.XML"), r'<181st>', r'<_181st>'),
-        (os.path.join(XML_DIR, "Units", "Space", "Units_Hero_Empire_181st_Fighter_Wing.XML"), r'</181st>', r'</_181st>'),
-        (os.path.join(XML_DIR, "Units", "Space", "Units_Hero_Empire_181st_Fighter_Wing_BU.xml"), r'<181st>', r'<_181st>'),
-        (os.path.join(XML_DIR, "Units", "Space", "Units_Hero_Empire_181st_Fighter_Wing_BU.xml"), r'</181st>', r'</_181st>'),
-        (os.path.join(XML_DIR, "Units", "Space", "Units_Hero_Minors_CSA_Tagge.XML"), r'<\?xml version="1.0"\?>\s*<80s_Visor_Man>', r'<?xml version="1.0"?>\n<_80s_Visor_Man>'),
-        (os.path.join(XML_DIR, "Units", "Space", "Units_Hero_Minors_CSA_Tagge.XML"), r'</80s_Visor_Man>', r'</_80s_Visor_Man>'),
-        (os.path.join(XML_DIR, "Units", "Space", "Units_Hero_Minors_CSA_Tagge.XML"), r'^<80s_Visor_Man>', r'<?xml version="1.0"?>\n<_80s_Visor_Man>')
-    ]
+    store = store or XmlDocumentStore()
 
     fixed_count = 0
-    for file_path, pattern, replacement in replacements:
-        if not os.path.exists(file_path): continue
+    stale = []  # (relative file, entry, why) for fixes that matched nothing
+    for rel_file, fixes in load_fix_registry().items():
+        file_path = os.path.join(XML_DIR, *rel_file.split('/'))
+        if not store.exists(file_path):
+            stale.extend((rel_file, entry, "file not found") for _, _, entry in fixes)
+            continue
         try:
-            with open(file_path, 'r', encoding='utf-8') as f: content = f.read()
-            new_content = re.sub(pattern, replacement, content, flags=re.MULTILINE)
+            content = new_content = store.read(file_path)
+            for pattern, replacement, entry in fixes:  # In order: a fix may build on the one before
+                new_content, count = pattern.subn(replacement, new_content)
+                if count:
+                    store.note(file_path, {"step": "fix", "pattern": entry["pattern"], "replacement": replacement})
+                    fixed_count += 1
+                else:
+                    stale.append((rel_file, entry, "pattern not found"))
             if new_content != content:
-                with open(file_path, 'w', encoding='utf-8') as f: f.write(new_content)
-                fixed_count += 1
+                store.write(file_path, new_content)
         except Exception as e: print(f"Error fixing {file_path}: {e}")
+    store.end_step()
 
     print(f"Applied fixes to {fixed_count} locations.")
+    if stale:
+        print(f"{len(stale)} fix(es) no longer match and can be removed from {os.path.basename(FIX_REGISTRY_PATH)}:")
+        for rel_file, entry, why in stale:
+            print(f"   {rel_file}: {why} ({entry['pattern']})")
 
 # --- SMART MODIFIER ---
 # Tags to remove from Neutral/Underworld units (all prerequisites except Tech_Level)
@@ -126,82 +854,423 @@ PREREQUISITE_TAGS = [
     "Tactical_Build_Prerequisites"
 ]
 
-def process_xml_content(content, faction_name, faction_pattern, file_path):
+# FILE-LEVEL EXCLUSION: Skip files with OTHER major faction keywords in name
+# e.g., if faction_name="Republic", skip files with "_Rebel_", "_Empire_", "_CIS_"
+# This prevents modifying Republic variants inside other faction files
+OTHER_FACTION_FILE_KEYWORDS = {
+    "Republic": ["Rebel", "Empire", "CIS", "Confederacy"],
+    "Empire": ["Rebel", "Republic", "CIS", "Confederacy"],
+    "Rebellion": ["Empire", "Republic", "CIS", "Confederacy"],  # Rebellion matches Rebel
+    "CIS": ["Rebel", "Empire", "Republic"]
+}
+
+# EXCLUDED FILES: Critical system files that should NEVER be converted or modified
+# Modifying these breaks the AI because they are base classes for ALL factions
+EXCLUDED_FILES = [
+    "_Default_Base.xml",
+    "_Attrition.xml",
+    "BuildPads.xml",  # Critical: Fixes AI economy/defense construction
+    "Research_Facilities_Default.xml",  # Critical: Fixes AI tech progression
+    "Shipyards_Default.xml",  # Critical: Fixes AI ship production
+    "Units_Space_Neutral_Freighters.xml", # Preserves base freighter classes
+    "Units_Space_Neutral_CEC_YT.xml"      # Preserves base YT classes
+]
+
+# CHEATS CONFIG: Time set to "1" to avoid game logic erors (infinity/disabled)
+# CHEATS CONFIG: Cost disabled, but Time/Limits enabled as requested
+CHEATS = {
+    # "Build_Cost_Credits": "1",
+    # "Tactical_Build_Cost_Multiplayer": "1",
+    "Build_Time_Seconds": "1",
+    "Tactical_Build_Time_Seconds": "1",
+    "Population_Value": "0",  # Pop remains 0
+    "Build_Limit_Current_Per_Player": "-1",
+    "Build_Limit_Lifetime_Per_Player": "-1",
+    "Build_Max_Instances_Per_Planet": "-1"
+}
+
+BLOCK_TYPES = "SpaceUnit|GroundUnit|Structure|SpaceBuildable|GroundBuildable|UpgradeObject|UniqueUnit|HeroUnit|Squadron|GroundCompany"
+BLOCK_PATTERN = re.compile(fr'(<({BLOCK_TYPES})\b[^>]*>)(.*?)(</\2>)', re.DOTALL | re.IGNORECASE)
+
+# Check if this is a Neutral or Underworld unit (for skirmish mode conversion)
+NEUTRAL_AFFILIATION_PATTERN = re.compile(r'<Affiliation>.*?(Neutral|Underworld).*?</Affiliation>', re.IGNORECASE | re.DOTALL)
+NAME_ATTR_PATTERN = re.compile(r'Name="([^"]+)"', re.IGNORECASE)
+CATEGORY_MASK_PATTERN = re.compile(r'<CategoryMask>([^<]+)</CategoryMask>', re.IGNORECASE)
+
+# Check if the filename or path contains a faction identifier (to skip faction-specific files)
+# Examples to SKIP: 
+#   - \Empire\Air_LAAT.xml (directory has Empire)
+#   - Units_Space_Neutral_CIS_* (filename has _CIS_)
+#   - Units_Hero_Republic_* (filename has _Republic_)
+# Examples to CONVERT:
+#   - Units_Space_Neutral_Hapan_* (no main faction)
+#   - Units_Hero_Underworld_* (no main faction)
+# Exclude Old_Republic, Old_Empire etc using negative look behind
+# We ensure the separator (\ or _) is NOT preceded by "Old"
+FACTION_PATH_PATTERN = re.compile(r'(?<!Old)(\\|_)(Republic|Empire|Rebel|CIS|Confederacy)(\\|_|\\.|_)', re.IGNORECASE)
+RESEARCH_PATH_PATTERN = re.compile(r'(Research|Upgrades)', re.IGNORECASE)
+
+# UNIVERSAL UNIT NAME SUFFIX FILTER: Map factions to their common suffixes/keywords
+FACTION_NAME_KEYWORDS = {
+    "Republic": ["Republic", "Rep"],
+    "Empire": ["Empire", "E"],
+    "Rebellion": ["Rebel", "R"],
+    "CIS": ["CIS", "Confederacy"]
+}
+# Additional faction/group keywords that never belong to the selected faction
+OTHER_GROUP_KEYWORDS = ["U", "Underworld", "HC", "Cartels", "CSA", "Warlords", "Hapan", "Mand", "Mandalorian", "H", "S", "Sith", "Naboo"]
+
+# Filter out non-buildable units (DUMMY structures, Garrison units, etc.)
+# Added extensive filter for "junk" objects like Crates, Ammo, Spawners, Debuffs, etc.
+NON_BUILDABLE_PATTERN = re.compile(r'DUMMY|ORBITAL|DELETE_STRUCTURE|UPGRADE|DOWNGRADE|_Garrison(_|$)|_G(_|$)|Cost|UC_|Crate|Container|Ammo|Spawner|Debuff|Penalty|Death|Walker|Trooper|Infantry|Prop|Structure|Test|Marker|Loot|Treasure', re.IGNORECASE)
+# Fallback check for capital ships
+CAPITAL_CATEGORY_PATTERN = re.compile(r'Capital|Destroyer|Cruiser|Carrier|Battleship|Dreadnought', re.IGNORECASE)
+
+class UnitNameClassifier:
     """
-    Parses top-level blocks via Regex (simulating XML traversal) and injects/updates tags.
-    Also converts Neutral/Underworld units to the selected faction for skirmish mode.
-    Returns: (modified_content, list of converted units, conversion_stats)
+    Answers the per-unit name questions for one faction selection.
+    Names are split into their '_' segments and checked against a keyword set,
+    instead of three re.search calls per keyword for every block.
     """
-    # FILE-LEVEL EXCLUSION: Skip files with OTHER major faction keywords in name
-    # e.g., if faction_name="Republic", skip files with "_Rebel_", "_Empire_", "_CIS_"
-    # This prevents modifying Republic variants inside other faction files
-    other_factions = {
-        "Republic": ["Rebel", "Empire", "CIS", "Confederacy"],
-        "Empire": ["Rebel", "Republic", "CIS", "Confederacy"],
-        "Rebellion": ["Empire", "Republic", "CIS", "Confederacy"],  # Rebellion matches Rebel
-        "CIS": ["Rebel", "Empire", "Republic"]
-    }
-    
-    # EXCLUDED FILES: Critical system files that should NEVER be converted or modified
-    # Modifying these breaks the AI because they are base classes for ALL factions
-    EXCLUDED_FILES = [
-        "_Default_Base.xml",
-        "_Attrition.xml",
-        "BuildPads.xml",  # Critical: Fixes AI economy/defense construction
-        "Research_Facilities_Default.xml",  # Critical: Fixes AI tech progression
-        "Shipyards_Default.xml",  # Critical: Fixes AI ship production
-        "Units_Space_Neutral_Freighters.xml", # Preserves base freighter classes
-        "Units_Space_Neutral_CEC_YT.xml"      # Preserves base YT classes
+
+    def __init__(self, faction_name):
+        keywords = []
+        for fac, fac_keywords in FACTION_NAME_KEYWORDS.items():
+            if fac != faction_name:
+                keywords.extend(fac_keywords)
+        keywords.extend(OTHER_GROUP_KEYWORDS)
+        self.faction_name = faction_name
+        self.other_keywords = frozenset(keyword.lower() for keyword in keywords)
+        self._non_buildable = {}
+
+    def belongs_to_other_faction(self, unit_name):
+        """
+        True if an other-faction keyword is a standalone segment of the name:
+        "CIS_Something", "Something_CIS_Something" or "Something_CIS".
+        """
+        segments = unit_name.lower().split('_')
+        # A name without '_' has no segment boundary, so no keyword can match
+        return len(segments) > 1 and not self.other_keywords.isdisjoint(segments)
+
+    def is_non_buildable(self, unit_name):
+        """
+        True for junk objects (DUMMY, Garrison, Crate, ...). These keywords are
+        substring matches, so this stays one precompiled regex, memoized per name.
+        """
+        result = self._non_buildable.get(unit_name)
+        if result is None:
+            result = self._non_buildable[unit_name] = bool(NON_BUILDABLE_PATTERN.search(unit_name))
+        return result
+
+    @staticmethod
+    def is_capital(category_mask):
+        return bool(CAPITAL_CATEGORY_PATTERN.search(category_mask))
+
+_NAME_CLASSIFIERS = {}
+
+def get_name_classifier(faction_name):
+    """Returns the UnitNameClassifier for a faction, built once per process."""
+    classifier = _NAME_CLASSIFIERS.get(faction_name)
+    if classifier is None:
+        classifier = _NAME_CLASSIFIERS[faction_name] = UnitNameClassifier(faction_name)
+    return classifier
+
+@functools.lru_cache(maxsize=None)
+def other_faction_file_pattern(faction_name):
+    """Filename check for OTHER_FACTION_FILE_KEYWORDS, or None for unknown factions."""
+    keywords = OTHER_FACTION_FILE_KEYWORDS.get(faction_name)
+    if not keywords:
+        return None
+    # Check for faction keyword with separator (avoid matching "Old_Republic", "Old_Empire")
+    # Match patterns like "_Rebel_", "_Empire_", etc.
+    return re.compile(fr'(?<!Old)[_\\](?:{"|".join(keywords)})[_\\]', re.IGNORECASE)
+
+@functools.lru_cache(maxsize=None)
+def faction_affiliation_pattern(faction_pattern):
+    return re.compile(fr"<Affiliation>.*{faction_pattern}.*</Affiliation>", re.IGNORECASE)
+
+# --- TAG UPSERT ENGINE ---
+# A rule describes what happens to one tag inside a unit block:
+#   action "set"     -> keep <Tag>...</Tag>, replace the value
+#   action "replace" -> rewrite the whole element as "<Tag>value</Tag>\n\t\t"
+#   action "remove"  -> drop the element and the whitespace after it
+# multiline:  value may span lines (DOTALL); otherwise it must stay on one line
+# numeric:    only match values made of digits (plus surrounding whitespace)
+# first_only: only the first occurrence is edited
+# present_if_open: the tag counts as present as soon as <Tag> appears, even if no edit matched
+# missing:    None, "append" (add "\n\t\t<Tag>value</Tag>" at the end of the block)
+#             or "after:<Other_Tag>" (insert "\n\t\t<Tag>value</Tag>" after the first </Other_Tag>)
+TagRule = collections.namedtuple(
+    "TagRule", "tag action value multiline numeric first_only present_if_open missing")
+
+def tag_rule(tag, action, value="", multiline=True, numeric=False, first_only=False, present_if_open=False, missing=None):
+    return TagRule(tag, action, value, multiline, numeric, first_only, present_if_open, missing)
+
+NUMERIC_VALUE_PATTERN = re.compile(r'\s*\d+\s*')
+TRAILING_SPACE_PATTERN = re.compile(r'\s*')
+
+@functools.lru_cache(maxsize=None)
+def tag_scanner(keys, ignore_case=False):
+    """One regex finding the opening tag of every rule in a rule set (lowercase keys)."""
+    return re.compile("<(" + "|".join(re.escape(key) for key in keys) + ")>", re.IGNORECASE if ignore_case else 0)
+
+@functools.lru_cache(maxsize=None)
+def closing_tag_pattern(key):
+    return re.compile(f"</{re.escape(key)}>", re.IGNORECASE)
+
+def upsert_tags(inner, rules, edit_log=None):
+    """
+    Applies every rule to a block's inner content in a single scan.
+    Equivalent to running one search/sub pass per rule in order (for well-formed
+    blocks), but the block is scanned once and rebuilt once from the collected edits.
+    If edit_log is a list, [tag, action, old_value, new_value] is appended per edit.
+    """
+    rules_by_tag = {rule.tag.lower(): rule for rule in rules}
+
+    # Scan a lowercased copy with a case-sensitive regex: much faster than IGNORECASE.
+    # Offsets are shared with `inner` unless lowercasing changed the length (rare non-ASCII).
+    lower = inner.lower()
+    if len(lower) != len(inner):
+        lower = None
+
+    def find_close(key, start):
+        if lower is not None:
+            return lower.find(f"</{key}>", start)
+        close = closing_tag_pattern(key).search(inner, start)
+        return close.start() if close else -1
+
+    edits = []  # (start, end, replacement) on the original string
+    matched = set()
+    opened = set()
+    cursor = 0  # Everything before this offset is already consumed by an edit
+
+    scanner = tag_scanner(tuple(rules_by_tag), ignore_case=lower is None)
+    for match in scanner.finditer(inner if lower is None else lower):
+        key = match.group(1).lower()
+        opened.add(key)
+        if match.start() < cursor:
+            continue  # Tag nested inside an element that was already edited
+        rule = rules_by_tag[key]
+        if rule.first_only and key in matched:
+            continue
+        close_start = find_close(key, match.end())
+        if close_start < 0:
+            continue
+        close_end = close_start + len(key) + 3
+        value = inner[match.end():close_start]
+        if not rule.multiline and '\n' in value:
+            continue
+        if rule.numeric and not NUMERIC_VALUE_PATTERN.fullmatch(value):
+            continue
+
+        matched.add(key)
+        if edit_log is not None:
+            edit_log.append([rule.tag, rule.action, value, None if rule.action == "remove" else rule.value])
+        if rule.action == "set":
+            edits.append((match.end(), close_start, rule.value))
+            cursor = close_start
+        elif rule.action == "replace":
+            edits.append((match.start(), close_end, f"<{rule.tag}>{rule.value}</{rule.tag}>\n\t\t"))
+            cursor = close_end
+        else:  # remove
+            cursor = TRAILING_SPACE_PATTERN.match(inner, close_end).end()
+            edits.append((match.start(), cursor, ""))
+
+    appends = []
+    for rule in rules:
+        key = rule.tag.lower()
+        if not rule.missing or key in matched or (rule.present_if_open and key in opened):
+            continue
+        element = f"\n\t\t<{rule.tag}>{rule.value}</{rule.tag}>"
+        if edit_log is not None:
+            edit_log.append([rule.tag, "add", None, rule.value])
+        if rule.missing == "append":
+            appends.append(element)
+        else:
+            anchor_key = rule.missing.split(":", 1)[1].lower()
+            anchor = find_close(anchor_key, 0)
+            if anchor >= 0:
+                anchor += len(anchor_key) + 3
+                edits.append((anchor, anchor, element))
+
+    if not edits and not appends:
+        return inner
+    edits.sort(key=lambda edit: (edit[0], edit[1]))
+    pieces = []
+    position = 0
+    for start, end, replacement in edits:
+        pieces.append(inner[position:start])
+        pieces.append(replacement)
+        position = end
+    pieces.append(inner[position:])
+    pieces.extend(appends)
+    return "".join(pieces)
+
+@functools.lru_cache(maxsize=None)
+def conversion_rules(faction_name):
+    """Rules turning a Neutral/Underworld unit into a buildable unit of the selected faction."""
+    # Use correct skirmish shipyard names
+    faction_shipyard = f"{faction_name}_Frigate_Shipyard" # Default
+    if faction_name == "Empire": faction_shipyard = "E_Frigate_Shipyard"
+    elif faction_name == "Rebel": faction_shipyard = "R_Frigate_Shipyard"
+    elif faction_name == "CIS": faction_shipyard = "CIS_Frigate_Shipyard"
+    elif faction_name == "Republic": faction_shipyard = "Republic_Frigate_Shipyard"
+
+    rules = [
+        # Change affiliation to the selected faction
+        tag_rule("Affiliation", "set", faction_name, first_only=True),
+        # Replace existing shipyard requirement, or inject a new tag after Affiliation
+        tag_rule("Required_Special_Structures", "replace", faction_shipyard,
+                 present_if_open=True, missing="after:Affiliation"),
     ]
+    # Remove other build prerequisites (but keep Tech_Level and Required_Star_Base_Level)
+    for prereq_tag in PREREQUISITE_TAGS:
+        if prereq_tag != "Required_Special_Structures":  # Handled above
+            rules.append(tag_rule(prereq_tag, "remove"))
+    rules += [
+        # FORCE Level 5 Starbase Requirement for Converted Squadrons/Neutral Units (RP style)
+        tag_rule("Required_Star_Base_Level", "set", "5", numeric=True, missing="append"),
+        # Change Tech_Level from ANY to 1 (enabled) for converted units to ensure availability
+        tag_rule("Tech_Level", "set", "1", multiline=False, missing="append"),
+        # Force Build Tab and Unlock
+        tag_rule("Build_Tab_Space_Units", "set", "Yes", multiline=False, present_if_open=True, missing="append"),
+        tag_rule("Build_Initially_Locked", "set", "No", multiline=False, present_if_open=True, missing="append"),
+    ]
+    return tuple(rules)
 
-    filename = os.path.basename(file_path)
-    if filename in EXCLUDED_FILES:
-        return content, [], {
-            'squadrons': 0,
-            'frigates': 0,
-            'capitals': 0,
-            'heroes': 0,
-            'research': 0,
-            'neutral_converted': 0,
-            'faction_modified': 0,
-            'units_with_cheats': []
-        }
+@functools.lru_cache(maxsize=None)
+def cheat_rules(is_research_or_upgrade):
+    """Standard CHEATS rules applied to every matching unit."""
+    rules = []
+    for tag, value in CHEATS.items():
+        final_value = value
+        
+        # Special handling for Research/Upgrades
+        if is_research_or_upgrade:
+            if tag == "Build_Limit_Lifetime_Per_Player":
+                final_value = "1" # Force limit of 1 for research
+            elif tag.startswith("Build_Limit"):
+                continue # Skip other build limit tags for research
+        rules.append(tag_rule(tag, "set", final_value, missing="append"))
+    return tuple(rules)
 
-    if faction_name in other_factions:
-        for other_faction in other_factions[faction_name]:
-            # Check for faction keyword with separator (avoid matching "Old_Republic", "Old_Empire")
-            # Match patterns like "_Rebel_", "_Empire_", etc.
-            if re.search(fr'(?<!Old)[_\\]{other_faction}[_\\]', filename, re.IGNORECASE):
-                # This file belongs to another faction - skip entirely
-                return content, [], {
-                    'squadrons': 0,
-                    'frigates': 0,
-                    'capitals': 0,
-                    'heroes': 0,
-                    'research': 0,
-                    'neutral_converted': 0,
-                    'faction_modified': 0,
-                    'units_with_cheats': []
-                }
-    
-    # CHEATS CONFIG: Time set to "1" to avoid game logic erors (infinity/disabled)
-    # CHEATS CONFIG: Cost disabled, but Time/Limits enabled as requested
-    CHEATS = {
-        # "Build_Cost_Credits": "1",
-        # "Tactical_Build_Cost_Multiplayer": "1",
-        "Build_Time_Seconds": "1",
-        "Tactical_Build_Time_Seconds": "1",
-        "Population_Value": "0",  # Pop remains 0
-        "Build_Limit_Current_Per_Player": "-1",
-        "Build_Limit_Lifetime_Per_Player": "-1",
-        "Build_Max_Instances_Per_Planet": "-1"
-    }
+# --- BLOCK TOKENIZER ---
+# Finds the top-level object blocks (BLOCK_TYPES) with plain string scanning instead of
+# one big lazy regex: comments, CDATA, processing instructions and self-closing tags
+# are skipped, nested elements of the same tag are matched to their own closing tag,
+# and input can be fed in chunks so a file never has to be held in memory whole.
+BLOCK_TYPE_NAMES = frozenset(name.lower() for name in BLOCK_TYPES.split("|"))
+TOKENIZER_CHUNK_SIZE = 64 * 1024
+TAG_NAME_PATTERN = re.compile(r'</?([A-Za-z_][\w.:-]*)')
+TAG_NAME_PATTERN_BYTES = re.compile(TAG_NAME_PATTERN.pattern.encode())
 
-    types = "SpaceUnit|GroundUnit|Structure|SpaceBuildable|GroundBuildable|UpgradeObject|UniqueUnit|HeroUnit|Squadron|GroundCompany"
-    block_pattern = re.compile(fr'(<({types})\b[^>]*>)(.*?)(</\2>)', re.DOTALL | re.IGNORECASE)
-    
-    converted_units = []  # Track converted units for shipyard injection
-    conversion_stats = {
+class BlockTokenizer:
+    """
+    Incremental scanner for top-level blocks. feed() takes str or bytes chunks (all of
+    one kind) and returns the (start, end) offsets, counted from the start of the whole
+    input, of every block completed so far; with keep_blocks=True it returns
+    (start, end, block_text) instead. Only the unfinished block (or tag) is buffered.
+    """
+
+    def __init__(self, keep_blocks=False):
+        self.keep_blocks = keep_blocks
+        self.buffer = None
+        self.base = 0           # Input offset of buffer[0]
+        self.pos = 0            # Scan position inside buffer
+        self.block_start = -1   # Buffer index of the open block's start tag, -1 outside blocks
+        self.block_name = None
+        self.depth = 0
+
+    def feed(self, chunk, final=False):
+        if self.buffer is None:
+            self.buffer = chunk[:0]
+            binary = isinstance(chunk, bytes)
+            self.lt, self.slash, self.gt = (b"<", b"/", b">") if binary else ("<", "/", ">")
+            self.markers = [(b"<!--", b"-->"), (b"<![CDATA[", b"]]>"), (b"<?", b"?>"), (b"<!", b">")] if binary else \
+                           [("<!--", "-->"), ("<![CDATA[", "]]>"), ("<?", "?>"), ("<!", ">")]
+            self.name_pattern = TAG_NAME_PATTERN_BYTES if binary else TAG_NAME_PATTERN
+        if chunk:
+            self.buffer += chunk
+        buffer = self.buffer
+        size = len(buffer)
+        blocks = []
+        pos = self.pos
+        while True:
+            i = buffer.find(self.lt, pos)
+            if i < 0:
+                pos = size
+                break
+            if not final and size - i < 9:
+                pos = i  # "<!-" vs "<![CDATA[" needs a few more bytes to tell apart
+                break
+            end = -1
+            for opener, closer in self.markers:
+                if buffer.startswith(opener, i):
+                    end = buffer.find(closer, i + len(opener))
+                    if end >= 0:
+                        end += len(closer)
+                    break
+            else:
+                end = buffer.find(self.gt, i + 1)
+                if end >= 0:
+                    end += 1
+                    match = self.name_pattern.match(buffer, i)
+                    if match:
+                        self._tag(buffer, i, end, match, blocks)
+            if end < 0:
+                pos = size if final else i  # Unterminated token: wait for more, or give up at EOF
+                break
+            pos = end
+
+        # Keep only what an unfinished block or token still needs
+        keep = self.block_start if self.block_start >= 0 else pos
+        if keep:
+            self.buffer = buffer[keep:]
+            self.base += keep
+            pos -= keep
+            if self.block_start >= 0:
+                self.block_start = 0
+        self.pos = pos
+        return blocks
+
+    def _tag(self, buffer, i, end, match, blocks):
+        name = match.group(1)
+        if not isinstance(name, str):
+            name = name.decode('ascii')
+        name = name.lower()
+        closing = buffer[i + 1:i + 2] == self.slash
+        if buffer[end - 2:end - 1] == self.slash and not closing:
+            return  # Self-closing: opens and closes nothing
+        if self.block_start < 0:
+            if not closing and name in BLOCK_TYPE_NAMES:
+                self.block_start, self.block_name, self.depth = i, name, 1
+            return
+        if name != self.block_name:
+            return
+        self.depth += -1 if closing else 1
+        if self.depth == 0:
+            start = self.base + self.block_start
+            if self.keep_blocks:
+                blocks.append((start, self.base + end, buffer[self.block_start:end]))
+            else:
+                blocks.append((start, self.base + end))
+            self.block_start, self.block_name = -1, None
+
+def block_spans(content):
+    """(start, end) offsets of the top-level blocks of a whole str or bytes document."""
+    return BlockTokenizer().feed(content, final=True)
+
+def iter_file_blocks(f, chunk_size=TOKENIZER_CHUNK_SIZE):
+    """Yields (start, end, block_bytes) for a binary file object, reading it chunk by chunk."""
+    tokenizer = BlockTokenizer(keep_blocks=True)
+    while True:
+        chunk = f.read(chunk_size)
+        yield from tokenizer.feed(chunk, final=not chunk)
+        if not chunk:
+            return
+
+def empty_conversion_stats():
+    return {
         'squadrons': 0,
         'frigates': 0,
         'capitals': 0,
@@ -209,92 +1278,65 @@ def process_xml_content(content, faction_name, faction_pattern, file_path):
         'research': 0,
         'neutral_converted': 0,
         'faction_modified': 0,
-        'units_with_cheats': []  # List of (unit_name, unit_type) that had cheats applied
+        'blocks_matched': 0,
+        'units_with_cheats': []  # List of unit names that had cheats applied
     }
+
+def make_block_modifier(faction_name, faction_pattern, file_path, record_edits=False):
+    """
+    Builds the per-block rewrite callback for one file.
+    With record_edits, conversion_stats['blocks'] lists every changed block and its tag edits.
+    Returns: (modify_block(match), converted_units, conversion_stats), or None if the
+    whole file must be left alone (excluded or belongs to another faction).
+    """
+    filename = os.path.basename(file_path)
+    if filename in EXCLUDED_FILES:
+        return None
+
+    other_faction_file = other_faction_file_pattern(faction_name)
+    if other_faction_file and other_faction_file.search(filename):
+        # This file belongs to another faction - skip entirely
+        return None
+
+    classifier = get_name_classifier(faction_name)
+    faction_affiliation = faction_affiliation_pattern(faction_pattern)
+
+    # Per-file facts, identical for every block in this file
+    file_has_faction = bool(FACTION_PATH_PATTERN.search(file_path))
+    # UpgradeObjects don't have <Affiliation> tags - they're organized by directory
+    # e.g., /Upgrades/Skirmish/Space/Republic/ or /Upgrades/GC/Republic/
+    upgrade_in_faction_dir = faction_name.lower() in file_path.lower()
+    # Skip build limits for Research/Upgrades/UpgradeObject (they don't make sense for technologies)
+    is_research_file = bool(RESEARCH_PATH_PATTERN.search(file_path))
+
+    converted_units = []  # Track converted units for shipyard injection
+    conversion_stats = empty_conversion_stats()
+    if record_edits:
+        conversion_stats['blocks'] = []
     
     def modify_block(match):
+        conversion_stats['blocks_matched'] += 1
         start_tag = match.group(1)
         tag_type = match.group(2)
         inner_content = match.group(3)
         end_tag = match.group(4)
         
-        # Check if this is a Neutral or Underworld unit (for skirmish mode conversion)
-        is_neutral_or_underworld = bool(re.search(r'<Affiliation>.*?(Neutral|Underworld).*?</Affiliation>', inner_content, re.IGNORECASE | re.DOTALL))
-        
-        # Check if the filename or path contains a faction identifier (to skip faction-specific files)
-        # Examples to SKIP: 
-        #   - \Empire\Air_LAAT.xml (directory has Empire)
-        #   - Units_Space_Neutral_CIS_* (filename has _CIS_)
-        #   - Units_Hero_Republic_* (filename has _Republic_)
-        # Examples to CONVERT:
-        #   - Units_Space_Neutral_Hapan_* (no main faction)
-        #   - Units_Hero_Underworld_* (no main faction)
-        # Exclude Old_Republic, Old_Empire etc using negative look behind
-        # We ensure the separator (\ or _) is NOT preceded by "Old"
-        faction_keywords = r'(?<!Old)(\\|_)(Republic|Empire|Rebel|CIS|Confederacy)(\\|_|\\.|_)'
-        file_has_faction = bool(re.search(faction_keywords, file_path, re.IGNORECASE))
+        # UNIVERSAL UNIT NAME SUFFIX FILTER: Skip units with OTHER faction suffixes
+        # This applies to ALL block types (units, buildings, structures, upgrades)
+        name_match = NAME_ATTR_PATTERN.search(start_tag)
+        unit_name = name_match.group(1) if name_match else None
+        if unit_name and classifier.belongs_to_other_faction(unit_name):
+            # Skip this unit - it belongs to another faction
+            return match.group(0)
+
+        is_neutral_or_underworld = bool(NEUTRAL_AFFILIATION_PATTERN.search(inner_content))
         
         # Only convert truly neutral/underworld units (not faction-specific variants or files in faction directories)
         should_convert_neutral = is_neutral_or_underworld and not file_has_faction
         
         # SPECIAL HANDLING FOR UPGRADEOBJECTS:
-        # UpgradeObjects don't have <Affiliation> tags - they're organized by directory
         # Check if this is an UpgradeObject in a faction-specific directory
         is_upgrade_object = tag_type.lower() == "upgradeobject"
-        upgrade_in_faction_dir = False
-        if is_upgrade_object:
-            # Check if file path contains faction-specific directory
-            # e.g., /Upgrades/Skirmish/Space/Republic/ or /Upgrades/GC/Republic/
-            if faction_name.lower() in file_path.lower():
-                upgrade_in_faction_dir = True
-        
-        # UNIVERSAL UNIT NAME SUFFIX FILTER: Skip units with OTHER faction suffixes
-        # This applies to ALL block types (units, buildings, structures, upgrades)
-        # Extract unit name
-        name_match = re.search(r'Name="([^"]+)"', start_tag, re.IGNORECASE)
-        unit_name = name_match.group(1) if name_match else None
-        
-        if unit_name:
-            # Map factions to their common suffixes/keywords
-            faction_keywords_map = {
-                "Republic": ["Republic", "Rep"],
-                "Empire": ["Empire", "E"],
-                "Rebellion": ["Rebel", "R"],
-                "CIS": ["CIS", "Confederacy"]
-            }
-            
-            # Get other faction keywords (not the selected one)
-            other_keywords = []
-            for fac, keywords in faction_keywords_map.items():
-                if fac != faction_name:
-                    other_keywords.extend(keywords)
-            
-            # Add additional faction/group keywords
-            other_keywords.extend(["U", "Underworld", "HC", "Cartels", "CSA", "Warlords", "Hapan", "Mand", "Mandalorian", "H", "S", "Sith", "Naboo"])
-            
-            # Check if this unit has an other-faction keyword ANYWHERE in the name
-            # Look for keywords as standalone segments (between underscores or at start/end)
-            has_other_faction_keyword = False
-            for keyword in other_keywords:
-                # Check for keyword as:
-                # - At start: "CIS_Something"
-                # - In middle: "Something_CIS_Something"  
-                # - At end: "Something_CIS"
-                patterns = [
-                    f"^{keyword}_",      # Starts with keyword_
-                    f"_{keyword}_",      # Contains _keyword_
-                    f"_{keyword}$"       # Ends with _keyword
-                ]
-                for pattern in patterns:
-                    if re.search(pattern, unit_name, re.IGNORECASE):
-                        has_other_faction_keyword = True
-                        break
-                if has_other_faction_keyword:
-                    break
-            
-            # Skip this unit - it belongs to another faction
-            if has_other_faction_keyword:
-                return match.group(0)
         
         # STRICT BLOCK-LEVEL MATCHING: Only modify this block if:
         # 1. It's a neutral/underworld unit eligible for conversion, OR
@@ -307,21 +1349,19 @@ def process_xml_content(content, faction_name, faction_pattern, file_path):
         elif is_upgrade_object and upgrade_in_faction_dir:
             # UpgradeObject in faction-specific directory - process it
             block_matches = True
-        elif re.search(fr"<Affiliation>.*{faction_pattern}.*</Affiliation>", inner_content, re.IGNORECASE):
+        elif faction_affiliation.search(inner_content):
             # This block specifically has the selected faction - modify it
             block_matches = True
         
         if not block_matches:
             return match.group(0)
-            
-        new_inner = inner_content
         
         # If this is a truly Neutral/Underworld unit and we have a specific faction selected, convert it
         if should_convert_neutral:
             conversion_stats['neutral_converted'] += 1
             
             # Extract CategoryMask to determine shipyard type
-            category_match = re.search(r'<CategoryMask>([^<]+)</CategoryMask>', inner_content, re.IGNORECASE)
+            category_match = CATEGORY_MASK_PATTERN.search(inner_content)
             category_mask = category_match.group(1) if category_match else ""
             
             # Only track SpaceUnit, Squadron, and Hero types (NOT SpaceBuildable/buildings)
@@ -330,9 +1370,7 @@ def process_xml_content(content, faction_name, faction_pattern, file_path):
             
             if unit_name and unit_type in valid_types:
                 # Filter out non-buildable units (DUMMY structures, Garrison units, etc.)
-                # Added extensive filter for "junk" objects like Crates, Ammo, Spawners, Debuffs, etc.
-                non_buildable_keywords = r'DUMMY|ORBITAL|DELETE_STRUCTURE|UPGRADE|DOWNGRADE|_Garrison(_|$)|_G(_|$)|Cost|UC_|Crate|Container|Ammo|Spawner|Debuff|Penalty|Death|Walker|Trooper|Infantry|Prop|Structure|Test|Marker|Loot|Treasure'
-                if re.search(non_buildable_keywords, unit_name, re.IGNORECASE):
+                if classifier.is_non_buildable(unit_name):
                     # Skip this unit - it's not meant to be buildable by players
                     pass
                 else:
@@ -349,158 +1387,184 @@ def process_xml_content(content, faction_name, faction_pattern, file_path):
                              conversion_stats['heroes'] += 1
                         else:
                              # Fallback check for capital ships
-                             is_capital = bool(re.search(r'Capital|Destroyer|Cruiser|Carrier|Battleship|Dreadnought', category_mask, re.IGNORECASE))
+                             is_capital = classifier.is_capital(category_mask)
                              converted_units.append((unit_name, "capital" if is_capital else "frigate"))
                              if is_capital:
                                  conversion_stats['capitals'] += 1
                              else:
                                  conversion_stats['frigates'] += 1
-            
-            # Change affiliation to the selected faction
-            affiliation_regex = re.compile(r'(<Affiliation>).*?(</Affiliation>)', re.IGNORECASE | re.DOTALL)
-            new_inner = affiliation_regex.sub(fr'\g<1>{faction_name}\g<2>', new_inner, count=1)
-            
-            # Use correct skirmish shipyard names
-            faction_shipyard = f"{faction_name}_Frigate_Shipyard" # Default
-            if faction_name == "Empire": faction_shipyard = "E_Frigate_Shipyard"
-            elif faction_name == "Rebel": faction_shipyard = "R_Frigate_Shipyard"
-            elif faction_name == "CIS": faction_shipyard = "CIS_Frigate_Shipyard"
-            elif faction_name == "Republic": faction_shipyard = "Republic_Frigate_Shipyard"
-            
-            # Check if tag exists
-            if re.search(r'<Required_Special_Structures>', inner_content, re.IGNORECASE):
-                 # Replace existing
-                structures_regex = re.compile(r'(<Required_Special_Structures>).*?(</Required_Special_Structures>)', re.IGNORECASE | re.DOTALL)
-                new_inner = structures_regex.sub(f'<Required_Special_Structures>{faction_shipyard}</Required_Special_Structures>\n\t\t', new_inner)
-            else:
-                # Inject new tag after Affiliation
-                affiliation_inject_regex = re.compile(r'(</Affiliation>)', re.IGNORECASE)
-                new_inner = affiliation_inject_regex.sub(fr'\1\n\t\t<Required_Special_Structures>{faction_shipyard}</Required_Special_Structures>', new_inner, count=1)
-            
-            # Remove other build prerequisites (but keep Tech_Level and Required_Star_Base_Level)
-            for prereq_tag in PREREQUISITE_TAGS:
-                if prereq_tag != "Required_Special_Structures":  # Skip, we already handled it above
-                    prereq_regex = re.compile(fr'<{prereq_tag}>.*?</{prereq_tag}>\s*', re.IGNORECASE | re.DOTALL)
-                    new_inner = prereq_regex.sub('', new_inner)
-            
-            # FORCE Level 5 Starbase Requirement for Converted Squadrons/Neutral Units (RP style)
-            if should_convert_neutral:
-                 # Update or Inject Required_Star_Base_Level -> 5
-                 level_regex = re.compile(r'(<Required_Star_Base_Level>)\s*\d+\s*(</Required_Star_Base_Level>)', re.IGNORECASE)
-                 if level_regex.search(new_inner):
-                     new_inner = level_regex.sub(r'\g<1>5\g<2>', new_inner)
-                 else:
-                     new_inner += '\n\t\t<Required_Star_Base_Level>5</Required_Star_Base_Level>'
-            
-            # Change Tech_Level from ANY to 1 (enabled) for converted units to ensure availability
-            tech_level_regex = re.compile(r'(<Tech_Level>).*?(</Tech_Level>)', re.IGNORECASE)
-            if tech_level_regex.search(new_inner):
-                new_inner = tech_level_regex.sub(r'\g<1>1\g<2>', new_inner)
-            else:
-                new_inner += '\n\t\t<Tech_Level>1</Tech_Level>'
-            
-            # Force Build Tab and Unlock
-            if re.search(r'<Build_Tab_Space_Units>', new_inner, re.IGNORECASE):
-                new_inner = re.sub(r'(<Build_Tab_Space_Units>).*?(</Build_Tab_Space_Units>)', r'\g<1>Yes\g<2>', new_inner, flags=re.IGNORECASE)
-            else:
-                new_inner += '\n\t\t<Build_Tab_Space_Units>Yes</Build_Tab_Space_Units>'
-
-            if re.search(r'<Build_Initially_Locked>', new_inner, re.IGNORECASE):
-                new_inner = re.sub(r'(<Build_Initially_Locked>).*?(</Build_Initially_Locked>)', r'\g<1>No\g<2>', new_inner, flags=re.IGNORECASE)
-            else:
-                  new_inner += '\n\t\t<Build_Initially_Locked>No</Build_Initially_Locked>'
         else:
             # Not a neutral conversion, just a regular faction modification
             conversion_stats['faction_modified'] += 1
         
         # Apply standard cheats to all matching units
         # Skip build limits for Research/Upgrades/UpgradeObject (they don't make sense for technologies)
-        is_research_or_upgrade = bool(re.search(r'(Research|Upgrades)', file_path, re.IGNORECASE)) or tag_type.lower() == "upgradeobject"
-        
-        # Extract unit name for debug tracking
-        name_match = re.search(r'Name="([^"]+)"', start_tag, re.IGNORECASE)
-        unit_name = name_match.group(1) if name_match else "Unknown"
+        is_research_or_upgrade = is_research_file or is_upgrade_object
         
         # Track that this unit had cheats applied
-        conversion_stats['units_with_cheats'].append(unit_name)
+        conversion_stats['units_with_cheats'].append(unit_name or "Unknown")
         
-        for tag, value in CHEATS.items():
-            final_value = value
-            
-            # Special handling for Research/Upgrades
-            if is_research_or_upgrade:
-                if tag == "Build_Limit_Lifetime_Per_Player":
-                    final_value = "1" # Force limit of 1 for research
-                elif tag.startswith("Build_Limit"):
-                    continue # Skip other build limit tags for research
-                
-            tag_regex = re.compile(fr'(<{tag}>)(.*?)(</{tag}>)', re.IGNORECASE | re.DOTALL)
-            
-            if tag_regex.search(new_inner):
-                # FIX: Use \g<1> and \g<3> to avoid ambiguity with numeric values
-                new_inner = tag_regex.sub(fr'\g<1>{final_value}\g<3>', new_inner)
-            else:
-                new_inner += f"\n\t\t<{tag}>{final_value}</{tag}>"
-                
+        # Conversion edits (if any) and cheats are applied in one scan of the block
+        rules = cheat_rules(is_research_or_upgrade)
+        if should_convert_neutral:
+            rules = conversion_rules(faction_name) + rules
+        edit_log = [] if record_edits else None
+        new_inner = upsert_tags(inner_content, rules, edit_log)
+        if edit_log:
+            conversion_stats['blocks'].append({"block": unit_name or "Unknown", "type": tag_type,
+                                               "converted": should_convert_neutral, "edits": edit_log})
         return f"{start_tag}{new_inner}{end_tag}"
 
-    new_content = block_pattern.sub(modify_block, content)
-    return new_content, converted_units, conversion_stats
+    return modify_block, converted_units, conversion_stats
 
-def inject_units_into_shipyard_rosters(faction_name, converted_units):
+def process_xml_content(content, faction_name, faction_pattern, file_path, record_edits=False):
+    """
+    Finds the top-level blocks with the BlockTokenizer and injects/updates tags.
+    Also converts Neutral/Underworld units to the selected faction for skirmish mode.
+    Returns: (modified_content, list of converted units, conversion_stats)
+    """
+    return process_xml_spans(content, block_spans(content), faction_name, faction_pattern, file_path, record_edits)
+
+def process_xml_spans(data, spans, faction_name, faction_pattern, file_path, record_edits=False, encoding='utf-8'):
+    """
+    Same rewrite as process_xml_content(), but only for the given (start, end)
+    spans. data may be str or the raw bytes of the file in an ASCII-compatible
+    encoding; for bytes only those blocks are decoded (and only changed ones
+    re-encoded), and the rest of the file is copied through untouched.
+    Returns: (modified_data, list of converted units, conversion_stats)
+    """
+    modifier = make_block_modifier(faction_name, faction_pattern, file_path, record_edits)
+    if modifier is None:
+        return data, [], empty_conversion_stats()
+    modify_block, converted_units, conversion_stats = modifier
+    binary = isinstance(data, bytes)
+    view = memoryview(data) if binary else data  # Unchanged stretches are joined without copies
+
+    pieces = []
+    position = 0
+    for start, end in spans:
+        block = str(view[start:end], encoding) if binary else data[start:end]
+        match = BLOCK_PATTERN.fullmatch(block)
+        if not match:
+            continue  # Catalog is out of date for this block; leave it untouched
+        new_block = modify_block(match)
+        if new_block != block:
+            pieces.append(view[position:start])
+            pieces.append(new_block.encode(encoding) if binary else new_block)
+            position = end
+    if not pieces:
+        return data, converted_units, conversion_stats
+    pieces.append(view[position:])
+    return data[:0].join(pieces), converted_units, conversion_stats
+
+def process_xml_bytes(data, spans, faction_name, faction_pattern, file_path, record_edits=False):
+    """
+    Rewrites a raw file without decoding it as a whole. ASCII-compatible encodings go
+    through process_xml_spans() on the bytes (the given spans, or every block); UTF-16
+    files, and files that turn out not to be in their detected encoding, are decoded
+    with decode_xml() and written back in the same encoding.
+    Returns: (modified_data, list of converted units, conversion_stats)
+    """
+    codec, _ = detect_xml_encoding(data)
+    if is_ascii_compatible(codec):
+        try:
+            return process_xml_spans(data, spans if spans is not None else block_spans(data),
+                                     faction_name, faction_pattern, file_path, record_edits, codec)
+        except UnicodeDecodeError:
+            pass  # Not really in that encoding: decode_xml() falls back to cp1252
+    text, encoding = decode_xml(data)
+    new_text, converted_units, conversion_stats = process_xml_content(text, faction_name, faction_pattern, file_path, record_edits)
+    return (encode_xml(new_text, encoding) if new_text != text else data), converted_units, conversion_stats
+
+# --- ROSTER MODEL ---
+# Every build location (shipyards, star bases of each level, research facilities) is
+# parsed once into an ordered set of its roster entries; units are added with an O(1)
+# membership check and each changed roster is written back in a single splice.
+BUILD_LOCATION_PATTERN = re.compile(r'<(SpaceBuildable|StarBase)\b[^>]*?\bName="([^"]+)"[^>]*>', re.IGNORECASE)
+ROSTER_PATTERN = re.compile(r'<Tactical_Buildable_Objects_Multiplayer>(.*?)</Tactical_Buildable_Objects_Multiplayer>', re.IGNORECASE | re.DOTALL)
+ROSTER_TOKEN_PATTERN = re.compile(r'[^,\s<>]+')
+STAR_BASE_5_PATTERN = re.compile(r'Skirmish_[^"]*?_Star_Base_5', re.IGNORECASE)
+
+class BuildRoster:
+    """
+    Ordered set of the object names in one build location's Tactical_Buildable_Objects_Multiplayer.
+    units maps each lowercased name to its listed spelling, so membership ignores case like the game.
+    """
+
+    def __init__(self, location, start, end, text):
+        self.location = location
+        self.start = start  # Span of the roster text inside the document
+        self.end = end
+        self.text = text
+        self.units = {}
+        for unit in ROSTER_TOKEN_PATTERN.findall(COMMENT_PATTERN.sub(' ', text)):  # Comments list no units
+            self.units.setdefault(unit.lower(), unit)
+        self.added = []
+
+    def add(self, units):
+        """Appends the units not listed yet; returns the ones actually added."""
+        added = []
+        for unit in units:
+            if unit.lower() not in self.units:
+                self.units[unit.lower()] = unit
+                added.append(unit)
+        self.added.extend(added)
+        return added
+
+    def serialize(self):
+        """Original roster text with the added entries appended, one per line."""
+        if not self.added:
+            return self.text
+        existing = self.text.rstrip()
+        listed = COMMENT_PATTERN.sub('', existing).rstrip()  # A trailing comment doesn't end the list
+        separator = "" if not listed or listed.endswith(",") else ","
+        return existing + separator + "\n\t\t\t\t" + ",\n\t\t\t\t".join(self.added) + "\n\t\t\t"
+
+def parse_build_rosters(content):
+    """BuildRoster for every SpaceBuildable/StarBase in the document that has a roster."""
+    rosters = []
+    for match in BUILD_LOCATION_PATTERN.finditer(content):
+        block_end = closing_tag_pattern(match.group(1)).search(content, match.end())
+        roster = ROSTER_PATTERN.search(content, match.end(), block_end.start() if block_end else len(content))
+        if roster:
+            rosters.append(BuildRoster(match.group(2), roster.start(1), roster.end(1), roster.group(1)))
+    return rosters
+
+def render_build_rosters(content, rosters):
+    """Document text with every changed roster spliced back in."""
+    pieces = []
+    position = 0
+    for roster in rosters:
+        if roster.added:
+            pieces.append(content[position:roster.start])
+            pieces.append(roster.serialize())
+            position = roster.end
+    if not pieces:
+        return content
+    pieces.append(content[position:])
+    return "".join(pieces)
+
+def inject_units_into_shipyard_rosters(faction_name, converted_units, store=None):
     """
     Injects converted Neutral/Underworld unit names into the faction's shipyard/starbase build rosters.
     
     Args:
         faction_name: Selected faction (Republic, CIS, Empire, Rebellion)
         converted_units: List of (unit_name, unit_type) tuples where unit_type is "squadron", "frigate", or "capital"
+        store: XmlDocumentStore to read/write through (default: the live folder)
     """
     if not converted_units:
         return
+    store = store or XmlDocumentStore()
     
-    # Map faction names to file paths and build location names
-    faction_config = {
-        "Republic": {
-            "shipyard_path": os.path.join(XML_DIR, "Buildings/Space/Skirmish/Republic/Shipyards.xml"),
-            "starbase_path": os.path.join(XML_DIR, "Buildings/Space/Skirmish/Republic/Starbases.xml"),
-            "research_path": os.path.join(XML_DIR, "Buildings/Space/Skirmish/Republic/Research_Facilities.xml"),
-            "frigate_name": "Republic_Frigate_Shipyard",
-            "capital_name": "Republic_Capital_Shipyard",
-            "starbase_name": "Skirmish_Republic_Star_Base_1",
-            "research_name": "Republic_Research_Facility"
-        },
-        "Empire": {
-            "shipyard_path": os.path.join(XML_DIR, "Buildings/Space/Skirmish/Empire/Shipyards.xml"),
-            "starbase_path": os.path.join(XML_DIR, "Buildings/Space/Skirmish/Empire/Starbases.xml"),
-            "research_path": os.path.join(XML_DIR, "Buildings/Space/Skirmish/Empire/Research_Facilities.xml"),
-            "frigate_name": "E_Frigate_Shipyard",
-            "capital_name": "E_Capital_Shipyard",
-            "starbase_name": "Skirmish_Empire_Star_Base_1",
-            "research_name": "Empire_Research_Facility"
-        },
-        "Rebellion": {
-            "shipyard_path": os.path.join(XML_DIR, "Buildings/Space/Skirmish/Rebel/Shipyards.xml"),
-            "starbase_path": os.path.join(XML_DIR, "Buildings/Space/Skirmish/Rebel/Starbases.xml"),
-            "research_path": os.path.join(XML_DIR, "Buildings/Space/Skirmish/Rebel/Research_Facilities.xml"),
-            "frigate_name": "R_Frigate_Shipyard",
-            "capital_name": "R_Capital_Shipyard",
-            "starbase_name": "Skirmish_Rebel_Star_Base_1",
-            "research_name": "Rebel_Research_Facility"
-        },
-        "CIS": {
-            "shipyard_path": os.path.join(XML_DIR, "Buildings/Space/Skirmish/CIS/Shipyards.xml"),
-            "starbase_path": os.path.join(XML_DIR, "Buildings/Space/Skirmish/CIS/Starbases.xml"),
-            "research_path": os.path.join(XML_DIR, "Buildings/Space/Skirmish/CIS/Research_Facilities.xml"),
-            "frigate_name": "CIS_Frigate_Shipyard",
-            "capital_name": "CIS_Capital_Shipyard",
-            "starbase_name": "Skirmish_CIS_Star_Base_1",
-            "research_name": "CIS_Research_Facility"
-        }
-    }
-    
-    config = faction_config.get(faction_name)
-    if not config:
+    buildings = SKIRMISH_BUILDINGS.get(faction_name)
+    if not buildings:
         return
+    skirmish_dir = os.path.join(XML_DIR, "Buildings", "Space", "Skirmish", buildings["folder"])
+    config = dict(buildings,
+                  shipyard_path=os.path.join(skirmish_dir, "Shipyards.xml"),
+                  starbase_path=os.path.join(skirmish_dir, "Starbases.xml"),
+                  research_path=os.path.join(skirmish_dir, "Research_Facilities.xml"))
     
     # Categorize units by type
     squadron_units = [name for name, unit_type in converted_units if unit_type == "squadron"]
@@ -508,118 +1572,56 @@ def inject_units_into_shipyard_rosters(faction_name, converted_units):
     capital_units = [name for name, unit_type in converted_units if unit_type == "capital"]
     research_units = [name for name, unit_type in converted_units if unit_type == "research"]
     
-    # Remove duplicates
-    squadron_units = list(set(squadron_units))
-    frigate_units = list(set(frigate_units))
-    capital_units = list(set(capital_units))
-    research_units = list(set(research_units))
+    # Remove duplicates, keeping discovery order so the rosters come out the same every run
+    squadron_units = list(dict.fromkeys(squadron_units))
+    frigate_units = list(dict.fromkeys(frigate_units))
+    capital_units = list(dict.fromkeys(capital_units))
+    research_units = list(dict.fromkeys(research_units))
     
     print(f"\nInjecting {len(squadron_units)} squadrons (Starbase), {len(frigate_units)} frigates, {len(capital_units)} capitals, and {len(research_units)} heroes into {faction_name} rosters...")
     
-    # Inject Squadrons into Starbase (ONLY Level 5 as requested by user for RP)
-    if squadron_units:
-        try:
-            with open(config["starbase_path"], 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # Find Skirmish StarBase Level 5 definitions in the file
-            # e.g., <StarBase Name="Skirmish_Republic_Star_Base_5"> ... </StarBase>
-            starbase_pattern = re.compile(r'(<StarBase Name="Skirmish_.*?_Star_Base_5">)(.*?)(</StarBase>)', re.IGNORECASE | re.DOTALL)
-            
-            def inject_into_starbase(match):
-                sb_start = match.group(1)
-                sb_inner = match.group(2)
-                sb_end = match.group(3)
-                
-                # Check if it has a buildable object list
-                roster_pattern = re.compile(r'(<Tactical_Buildable_Objects_Multiplayer>)(.*?)(</Tactical_Buildable_Objects_Multiplayer>)', re.IGNORECASE | re.DOTALL)
-                
-                if roster_pattern.search(sb_inner):
-                     # Inject units into existing list
-                     # Check which units are already present to avoid duplicates
-                     existing_roster = roster_pattern.search(sb_inner).group(2)
-                     units_to_add = [u for u in squadron_units if u not in existing_roster]
-                     
-                     if units_to_add:
-                         injection_str = "\n\t\t\t\t" + ",\n\t\t\t\t".join(units_to_add) + ","
-                         new_sb_inner = roster_pattern.sub(fr'\g<1>\g<2>{injection_str}\g<3>', sb_inner)
-                         return f"{sb_start}{new_sb_inner}{sb_end}"
-                
-                return match.group(0) # Return unchanged if no roster found or no units needed
-            
-            new_content = starbase_pattern.sub(inject_into_starbase, content)
-            
-            if new_content != content:
-                with open(config["starbase_path"], 'w', encoding='utf-8') as f:
-                    f.write(new_content)
-                print(f"Successfully injected squadrons into Starbase Level 5 in {config['starbase_path']}")
-            else:
-                print(f"Warning: Could not find suitable Starbase Level 5 blocks or rosters in {config['starbase_path']}")
-                
-        except Exception as e:
-            print(f"Error injecting into Starbase: {e}")
-    
-    # Inject Frigates and Capitals into Shipyards
-    try:
-        with open(config["shipyard_path"], 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        # Inject units into Frigate Shipyard
-        if frigate_units:
-            frigate_pattern = rf'(<SpaceBuildable Name="{config["frigate_name"]}">.*?<Tactical_Buildable_Objects_Multiplayer>)(.*?)(</Tactical_Buildable_Objects_Multiplayer>)'
-            def inject_frigate(match):
-                start, roster, end = match.groups()
-                unit_list = ",\n\t\t\t\t" + ",\n\t\t\t\t".join(frigate_units)
-                return f"{start}{roster}{unit_list}\n\t\t\t{end}"
-            
-            content = re.sub(frigate_pattern, inject_frigate, content, flags=re.DOTALL | re.IGNORECASE)
-        
-        # Inject units into Capital Shipyard
-        if capital_units:
-            capital_pattern = rf'(<SpaceBuildable Name="{config["capital_name"]}">.*?<Tactical_Buildable_Objects_Multiplayer>)(.*?)(</Tactical_Buildable_Objects_Multiplayer>)'
-            def inject_capital(match):
-                start, roster, end = match.groups()
-                unit_list = ",\n\t\t\t\t" + ",\n\t\t\t\t".join(capital_units)
-                return f"{start}{roster}{unit_list}\n\t\t\t{end}"
-            
-            content = re.sub(capital_pattern, inject_capital, content, flags=re.DOTALL | re.IGNORECASE)
-        
-        with open(config["shipyard_path"], 'w', encoding='utf-8') as f:
-            f.write(content)
-        
-        print(f"Successfully injected units into {config['shipyard_path']}")
-        
-    except Exception as e:
-        print(f"Error injecting units into shipyard rosters: {e}")
+    # (file, build location names, units, label); squadrons go ONLY to Starbase Level 5 as requested by user for RP
+    targets = [
+        (config["starbase_path"], STAR_BASE_5_PATTERN, squadron_units, "Starbase Level 5"),
+        (config["shipyard_path"], re.compile(re.escape(config["frigate_name"]), re.IGNORECASE), frigate_units, config["frigate_name"]),
+        (config["shipyard_path"], re.compile(re.escape(config["capital_name"]), re.IGNORECASE), capital_units, config["capital_name"]),
+        (config["research_path"], re.compile(re.escape(config["research_name"]), re.IGNORECASE), research_units, config["research_name"]),
+    ]
+    by_file = {}
+    for path, location_pattern, units, label in targets:
+        if units:
+            by_file.setdefault(path, []).append((location_pattern, units, label))
 
-    # Inject heroes into Research Facility
-    if research_units and "research_path" in config:
+    for path, entries in by_file.items():
         try:
-            with open(config["research_path"], 'r', encoding='utf-8') as f: content_res = f.read()
-            
-            # Pattern for research facility roster
-            res_pattern = rf'(<SpaceBuildable Name="{config["research_name"]}">.*?<Tactical_Buildable_Objects_Multiplayer>)(.*?)(</Tactical_Buildable_Objects_Multiplayer>)'
-            
-            def inject_res(match):
-                start, roster, end = match.groups()
-                # Check for existing units to avoid dupes logic could go here, but simple join is fast
-                unit_list = ",\n\t\t\t\t" + ",\n\t\t\t\t".join(research_units)
-                return f"{start}{roster}{unit_list}\n\t\t\t{end}"
-            
-            if re.search(res_pattern, content_res, re.DOTALL | re.IGNORECASE):
-                content_res = re.sub(res_pattern, inject_res, content_res, flags=re.DOTALL | re.IGNORECASE)
-                with open(config["research_path"], 'w', encoding='utf-8') as f: f.write(content_res)
-                print(f"Successfully injected {len(research_units)} heroes into Research Facility")
-            else:
-                print(f"Warning: Could not find Research roster for {config['research_name']}")
-                
+            content = store.read(path)
+            rosters = parse_build_rosters(content)
+            for location_pattern, units, label in entries:
+                matched = [roster for roster in rosters if location_pattern.fullmatch(roster.location)]
+                if not matched:
+                    print(f"Warning: Could not find a {label} roster in {path}")
+                    continue
+                added_count = 0
+                for roster in matched:
+                    added = roster.add(units)
+                    if added:
+                        store.note(path, {"step": "roster", "location": roster.location, "added": added})
+                        added_count += len(added)
+                print(f"Added {added_count} unit(s) to {label} ({len(units) * len(matched) - added_count} already listed)")
+
+            new_content = render_build_rosters(content, rosters)
+            if new_content != content:
+                store.write(path, new_content)
+                print(f"Successfully injected units into {path}")
         except Exception as e:
-            print(f"Error injecting into Research Facility: {e}")
+            print(f"Error injecting units into {path}: {e}")
+    store.end_step()
 
-def boost_starbase_income(faction_name):
+def boost_starbase_income(faction_name, store=None):
     """
     Injects massive income into the selected faction's Skirmish Starbase.
     """
+    store = store or XmlDocumentStore()
     faction_config = {
         "Republic": os.path.join(XML_DIR, "Buildings/Space/Skirmish/Republic/Starbases.xml"),
         "Empire": os.path.join(XML_DIR, "Buildings/Space/Skirmish/Empire/Starbases.xml"),
@@ -636,31 +1638,559 @@ def boost_starbase_income(faction_name):
     print_header(f"Step 3b: Boosting Starbase Income for ALL FACTIONS")
     
     for path in targets:
-        if not os.path.exists(path):
+        if not store.exists(path):
             print(f"Skipping {path}: File not found")
             continue
             
         try:
-            with open(path, 'r', encoding='utf-8') as f:
-                content = f.read()
+            content = store.read(path)
             
             # Boost Base_Income_Value to 100,000 (Massive Income)
             # Regex targets numeric values inside the tag
-            new_content = re.sub(r'<Base_Income_Value>[\d.]+</Base_Income_Value>', r'<Base_Income_Value>100000</Base_Income_Value>', content)
+            new_content, boosted = re.subn(r'<Base_Income_Value>[\d.]+</Base_Income_Value>', r'<Base_Income_Value>100000</Base_Income_Value>', content)
             
             if new_content != content:
-                with open(path, 'w', encoding='utf-8') as f:
-                    f.write(new_content)
+                store.write(path, new_content)
+                store.note(path, {"step": "income", "tag": "Base_Income_Value", "value": "100000", "count": boosted})
                 print(f"Massively increased income in {os.path.basename(path)}")
             else:
                 print(f"No income tags found to boost in {os.path.basename(path)}")
                 
         except Exception as e:
             print(f"Error boosting income in {path}: {e}")
+    store.end_step()
+
+# --- DIRECTORY INDEX ---
+# One os.scandir pass per Data/Xml folder and run records size, mtime and inode of every
+# XML file. Story/Campaign folders and Units/Ground are marked excluded at the top of
+# their subtree (they are still listed, because the symbol table needs their objects).
+# The backup's index is saved next to it so the next run can tell which files changed.
+# Each saved index gets a new generation number; the unit catalog records the generation
+# it was refreshed against and then only re-indexes the files the index reports changed.
+DIR_INDEX_NAME = "_skirmish_god_index.json"
+DIR_INDEX_VERSION = 1
+TREE_INDEXES = {}  # xml_dir -> XmlTreeIndex built this run
+SAVE_INDEXES = True  # --plan keeps the directory index and unit catalog in memory only
+
+def is_excluded_dir(rel_dir, name):
+    """True for folders apply_cheats() never touches (and everything below them)."""
+    return "Story" in name or "Campaign" in name or rel_dir.lower().startswith("units/ground")
+
+class XmlTreeIndex:
+    """
+    files: {rel_path: (size, mtime_ns, inode, excluded)} in os.walk order, '/' separators.
+    changed: rel paths added, changed or removed since the saved index (None without one).
+    generation: number of this index; base_generation: number of the saved index it was compared with.
+    """
+
+    def __init__(self, xml_dir, files, changed=None, generation=0, base_generation=None):
+        self.xml_dir = xml_dir
+        self.files = files
+        self.changed = changed
+        self.generation = generation
+        self.base_generation = base_generation
+
+    def path(self, rel_path):
+        return os.path.join(self.xml_dir, *rel_path.split('/'))
+
+    def xml_files(self):
+        """Absolute paths of every indexed XML file, excluded folders included."""
+        return [self.path(rel_path) for rel_path in self.files]
+
+    def target_files(self, target_dirs):
+        """Absolute paths of the files apply_cheats() processes, grouped by target dir."""
+        by_dir = collections.defaultdict(list)
+        for rel_path, entry in self.files.items():
+            if not entry[3] and "/" in rel_path:
+                by_dir[rel_path.split("/", 1)[0].lower()].append(rel_path)
+        return [os.path.join(self.xml_dir, rel_dir, *rel_path.split('/')[1:])
+                for rel_dir in target_dirs for rel_path in by_dir.get(rel_dir.lower(), ())]
+
+    def inode(self, path):
+        entry = self.files.get(os.path.relpath(path, self.xml_dir).replace(os.sep, '/'))
+        return entry[2] if entry else None
+
+def scan_xml_tree(xml_dir):
+    """{rel_path: (size, mtime_ns, inode, excluded)} of every XML file under xml_dir, in os.walk order."""
+    files = {}
+
+    def scan(dir_path, rel_dir, excluded):
+        try:
+            entries = list(os.scandir(dir_path))
+        except OSError:
+            return
+        subdirs = []
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry)
+            elif entry.name.lower().endswith(".xml"):
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                files[rel_dir + entry.name] = (st.st_size, st.st_mtime_ns, entry.inode(), excluded)
+        for entry in subdirs:
+            rel_sub = rel_dir + entry.name
+            scan(entry.path, rel_sub + "/", excluded or is_excluded_dir(rel_sub, entry.name))
+
+    scan(xml_dir, "", False)
+    return files
+
+def tree_index(xml_dir=None):
+    """
+    The run's XmlTreeIndex of xml_dir, scanned on first use. The backup's Data/Xml is
+    compared with (and then replaces) the index saved in the backup folder by the
+    previous run, whichever step asks for it first.
+    """
+    xml_dir = xml_dir or XML_DIR
+    index = TREE_INDEXES.get(xml_dir)
+    if index is not None:
+        return index
+    save_path = None
+    if os.path.normcase(os.path.abspath(xml_dir)) == os.path.normcase(os.path.abspath(os.path.join(BACKUP_DIR, "Data", "Xml"))):
+        save_path = os.path.join(BACKUP_DIR, DIR_INDEX_NAME)
+    files = scan_xml_tree(xml_dir)
+    changed = None
+    generation = base_generation = None
+    if save_path:
+        try:
+            with open(save_path, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+            if stored.get("version") == DIR_INDEX_VERSION:
+                previous = stored.get("files", {})
+                changed = [rel_path for rel_path, entry in files.items()
+                           if previous.get(rel_path) != [entry[0], entry[1]]]
+                changed += [rel_path for rel_path in previous if rel_path not in files]
+                generation = base_generation = stored.get("generation", 0)
+        except (OSError, ValueError):
+            pass
+        if changed is None or changed:
+            generation = (base_generation or 0) + 1
+            if SAVE_INDEXES:
+                tmp_path = save_path + ".tmp"
+                try:
+                    with open(tmp_path, 'w', encoding='utf-8') as f:
+                        json.dump({"version": DIR_INDEX_VERSION, "generation": generation,
+                                   "files": {rel_path: [entry[0], entry[1]] for rel_path, entry in files.items()}},
+                                  f, separators=(',', ':'))
+                    os.replace(tmp_path, save_path)
+                except OSError as e:
+                    print(f"Warning: Could not save directory index: {e}")
+    index = TREE_INDEXES[xml_dir] = XmlTreeIndex(xml_dir, files, changed, generation or 0, base_generation)
+    return index
+
+def forget_tree_index(xml_dir=None):
+    """Drops the run's index of xml_dir after files were added, removed or replaced under it."""
+    TREE_INDEXES.pop(xml_dir or XML_DIR, None)
+
+def backup_tree_index():
+    """Index of the backup's Data/Xml (saved in the backup folder), or None without a backup."""
+    backup_xml_dir = os.path.join(BACKUP_DIR, "Data", "Xml")
+    if not os.path.isdir(backup_xml_dir):
+        return None
+    return tree_index(backup_xml_dir)
+
+def collect_target_files(target_dirs, xml_dir=None):
+    """Lists the XML files apply_cheats() processes, in os.walk order (from the run's directory index)."""
+    return tree_index(xml_dir).target_files(target_dirs)
+
+# --- UNIT CATALOG ---
+# Persistent index of every block in the backup's target files, stored next to the
+# backup manifest and refreshed per file when its size/mtime changes.
+# One compact record per block: [start, end, tag_type, name, affiliation, category_mask, flags]
+#   start/end: byte span of the block in the file
+#   flags:     "N" if the block is Neutral/Underworld, plus every FACTIONS key whose
+#              affiliation pattern matches the block (same regexes as modify_block)
+CATALOG_NAME = "_skirmish_god_catalog.json"
+CATALOG_VERSION = 2
+BLOCK_PATTERN_BYTES = re.compile(BLOCK_PATTERN.pattern.encode(), re.DOTALL | re.IGNORECASE)
+AFFILIATION_VALUE_PATTERN = re.compile(r'<Affiliation>(.*?)</Affiliation>', re.IGNORECASE | re.DOTALL)
+
+def catalog_records(blocks, encoding='utf-8'):
+    """Catalog records for (start, end, block_bytes) blocks. Raises UnicodeDecodeError for blocks not in encoding."""
+    records = []
+    for start, end, block in blocks:
+        match = BLOCK_PATTERN_BYTES.fullmatch(block)
+        if not match:
+            continue
+        start_tag = match.group(1).decode(encoding)
+        tag_type = match.group(2).decode(encoding)
+        inner = match.group(3).decode(encoding)
+
+        name_match = NAME_ATTR_PATTERN.search(start_tag)
+        affiliation_match = AFFILIATION_VALUE_PATTERN.search(inner)
+        category_match = CATEGORY_MASK_PATTERN.search(inner)
+        flags = "N" if NEUTRAL_AFFILIATION_PATTERN.search(inner) else ""
+        for key, (_, pattern) in FACTIONS.items():
+            if faction_affiliation_pattern(pattern).search(inner):
+                flags += key
+        records.append([start, end, tag_type,
+                        name_match.group(1) if name_match else "",
+                        affiliation_match.group(1).strip() if affiliation_match else "",
+                        category_match.group(1).strip() if category_match else "",
+                        flags])
+    return records
+
+def catalog_file_blocks(data):
+    """Catalog records for every block of a raw file held in memory (None if byte offsets can't be used)."""
+    codec, _ = detect_xml_encoding(data)
+    if not is_ascii_compatible(codec):
+        return None
+    return catalog_records(((start, end, data[start:end]) for start, end in block_spans(data)), codec)
+
+def load_unit_catalog(target_dirs):
+    """
+    Loads the catalog of the backup's Data/Xml, re-indexing only the files the directory
+    index reports changed (or, if the catalog wasn't refreshed against the saved index,
+    those whose size/mtime changed). Returns {rel_path: {"size", "mtime", "blocks"}}, or
+    None if there is no backup yet. "blocks" is None for files that can't be indexed.
+    """
+    backup_xml_dir = os.path.join(BACKUP_DIR, "Data", "Xml")
+    if not os.path.isdir(backup_xml_dir):
+        return None
+
+    catalog_path = os.path.join(BACKUP_DIR, CATALOG_NAME)
+    cached = {}
+    cached_generation = None
+    try:
+        with open(catalog_path, 'r', encoding='utf-8') as f:
+            stored = json.load(f)
+        if stored.get("version") == CATALOG_VERSION:
+            cached = stored.get("files", {})
+            cached_generation = stored.get("index_generation")
+    except (OSError, ValueError):
+        pass
+
+    index = backup_tree_index()
+    if index.changed:
+        print(f"Directory index: {len(index.changed)} backup XML file(s) changed since the last run.")
+    # In step with the saved index: its change list says exactly which entries are stale
+    stale = None
+    if index.changed is not None and cached_generation is not None and cached_generation == index.base_generation:
+        stale = set(index.changed)
+    files = {}
+    reindexed = 0
+    for file_path in index.target_files(target_dirs):
+        rel_path = os.path.relpath(file_path, backup_xml_dir).replace(os.sep, '/')
+        size, mtime_ns = index.files[rel_path][:2]
+        entry = cached.get(rel_path)
+        if stale is not None:
+            fresh = entry is not None and rel_path not in stale
+        else:
+            fresh = entry is not None and entry["size"] == size and entry["mtime"] == mtime_ns
+        if fresh:
+            files[rel_path] = entry
+            continue
+        try:
+            with open(file_path, 'rb') as f:
+                codec, _ = detect_xml_encoding(f.read(256))
+                f.seek(0)
+                blocks = catalog_records(iter_file_blocks(f), codec) if is_ascii_compatible(codec) else None
+        except UnicodeDecodeError:
+            blocks = None
+        files[rel_path] = {"size": size, "mtime": mtime_ns, "blocks": blocks}
+        reindexed += 1
+
+    if reindexed or len(files) != len(cached) or cached_generation != index.generation:
+        if SAVE_INDEXES:
+            tmp_path = catalog_path + ".tmp"
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump({"version": CATALOG_VERSION, "index_generation": index.generation, "files": files},
+                              f, separators=(',', ':'))
+                os.replace(tmp_path, catalog_path)
+            except OSError as e:
+                print(f"Warning: Could not save unit catalog: {e}")
+        print(f"Unit catalog: re-indexed {reindexed} of {len(files)} backup file(s).")
+    return files
+
+def catalog_spans(catalog, file_path, faction_key, faction_name, read_path=None, index=None):
+    """
+    Byte spans of the blocks in file_path that can be relevant to the faction
+    (Neutral/Underworld, faction affiliation, UpgradeObject in the faction's folder).
+    read_path is where the file is actually read from (defaults to file_path); index is
+    the directory index of its folder, used instead of an os.stat() when given.
+    Returns None when the catalog can't vouch for the working file (process it fully),
+    or a possibly empty list of spans.
+    """
+    if catalog is None or faction_key is None:
+        return None
+    entry = catalog.get(os.path.relpath(file_path, XML_DIR).replace(os.sep, '/'))
+    if not entry or entry["blocks"] is None:
+        return None
+    if index is not None:
+        state = index.files.get(os.path.relpath(read_path or file_path, index.xml_dir).replace(os.sep, '/'))
+    else:
+        try:
+            st = os.stat(read_path or file_path)
+            state = (st.st_size, st.st_mtime_ns)
+        except OSError:
+            state = None
+    # Restore preserves mtimes, so a match means the working file is the cataloged backup file
+    if state is None or state[0] != entry["size"] or state[1] != entry["mtime"]:
+        return None
+    return relevant_spans(entry["blocks"], file_path, faction_key, faction_name)
+
+def relevant_spans(blocks, file_path, faction_key, faction_name):
+    """Spans of the catalog records the faction's modify_block can change."""
+    upgrade_in_faction_dir = faction_name.lower() in file_path.lower()
+    return [(start, end) for start, end, tag_type, _, _, _, flags in blocks
+            if "N" in flags or faction_key in flags
+            or (upgrade_in_faction_dir and tag_type.lower() == "upgradeobject")]
+
+# --- RESULT CACHE ---
+# Content-addressed cache of process_xml_file() results: one small JSON entry per
+# (file content, path, faction, rule set), next to the script. Entries are touched on
+# every hit and the least recently used ones are evicted above RESULT_CACHE_MAX_BYTES.
+# The key includes a hash of this script, so editing any rule table, pattern or
+# exclusion list invalidates the cache without a RULESET_VERSION bump.
+RESULT_CACHE_ENABLED = True
+RESULT_CACHE_NAME = "_skirmish_god_cache"
+RESULT_CACHE_MAX_BYTES = 256 << 20
+RULESET_VERSION = 5
+
+def result_cache_dir():
+    return os.path.join(SCRIPT_DIR, RESULT_CACHE_NAME) if RESULT_CACHE_ENABLED else None
+
+@functools.lru_cache(maxsize=None)
+def script_digest():
+    """Hash of this script's source: the rewrite depends on every table and pattern in it."""
+    try:
+        with open(os.path.abspath(__file__), 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    except OSError:
+        # No source to hash: fall back to the tables the rewrite reads
+        return repr((EXCLUDED_FILES, NON_BUILDABLE_PATTERN.pattern, FACTION_NAME_KEYWORDS, OTHER_GROUP_KEYWORDS,
+                     OTHER_FACTION_FILE_KEYWORDS, BLOCK_TYPES, PREREQUISITE_TAGS, CHEATS, SKIRMISH_BUILDINGS))
+
+@functools.lru_cache(maxsize=None)
+def ruleset_fingerprint(faction_name):
+    rules = (RULESET_VERSION, script_digest(), conversion_rules(faction_name), cheat_rules(True), cheat_rules(False))
+    return hashlib.sha1(repr(rules).encode('utf-8')).hexdigest()
+
+def result_cache_key(content, spans, file_path, faction_name, faction_pattern):
+    """Output depends on the content, the path (faction/research folder checks) and the rules."""
+    digest = hashlib.sha1(content if isinstance(content, bytes) else content.encode('utf-8'))
+    digest.update(repr((spans, file_path, faction_name, faction_pattern, ruleset_fingerprint(faction_name))).encode('utf-8'))
+    return digest.hexdigest()
+
+def load_cached_result(cache_dir, key):
+    """(new_content or None, converted_units, stats) for a cached key, or None on a miss."""
+    entry_path = os.path.join(cache_dir, key + ".json")
+    try:
+        with open(entry_path, 'r', encoding='utf-8') as f:
+            entry = json.load(f)
+        os.utime(entry_path)  # Most recently used
+    except (OSError, ValueError):
+        return None
+    new_content = entry["content"]
+    if new_content is not None and entry["bytes"]:
+        new_content = new_content.encode('latin-1')  # Raw bytes, whatever the file's encoding
+    return new_content, [tuple(unit) for unit in entry["units"]], entry["stats"]
+
+def save_cached_result(cache_dir, key, new_content, converted_units, stats):
+    entry = {
+        "bytes": isinstance(new_content, bytes),
+        "content": new_content.decode('latin-1') if isinstance(new_content, bytes) else new_content,
+        "units": converted_units,
+        "stats": stats,
+    }
+    entry_path = os.path.join(cache_dir, key + ".json")
+    tmp_path = f"{entry_path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, separators=(',', ':'))
+        os.replace(tmp_path, entry_path)
+    except OSError:
+        pass  # A missing cache entry only costs a recompute
+
+def prune_result_cache(cache_dir, max_bytes=None):
+    """Evicts least recently used entries until the cache fits. Returns the number evicted."""
+    max_bytes = RESULT_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    try:
+        entries = [(entry.stat().st_mtime_ns, entry.stat().st_size, entry.path)
+                   for entry in os.scandir(cache_dir) if entry.name.endswith(".json")]
+    except OSError:
+        return 0
+    total = sum(size for _, size, _ in entries)
+    evicted = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        evicted += 1
+    return evicted
+
+# --- BYTE PREFILTER ---
+# Conservative file-level versions of the block checks in modify_block(), run on the
+# raw bytes through mmap. A file that fails them cannot contain a block to modify.
+AFFILIATION_OPEN_BYTES = re.compile(rb'<Affiliation>', re.IGNORECASE)
+NEUTRAL_NAME_BYTES = re.compile(rb'Neutral|Underworld', re.IGNORECASE)
+UPGRADE_OBJECT_BYTES = re.compile(rb'<UpgradeObject\b', re.IGNORECASE)
+
+@functools.lru_cache(maxsize=None)
+def faction_affiliation_bytes_pattern(faction_pattern):
+    # Same line as the <Affiliation> tag, like the non-DOTALL block check
+    return re.compile(fr'<Affiliation>[^\n]*(?:{faction_pattern})'.encode(), re.IGNORECASE)
+
+def prefilter_file(file_path, faction_name, faction_pattern, read_path=None):
+    """
+    Returns False if the file cannot contain a block process_xml_content() would change:
+    excluded/other-faction filenames, or raw bytes with no Neutral/Underworld or faction
+    affiliation and no UpgradeObject in the faction's folder. The file is never decoded.
+    """
+    filename = os.path.basename(file_path)
+    if filename in EXCLUDED_FILES:
+        return False
+    other_faction_file = other_faction_file_pattern(faction_name)
+    if other_faction_file and other_faction_file.search(filename):
+        return False
+
+    with open(read_path or file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return False
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if not is_ascii_compatible(detect_xml_encoding(data[:256])[0]):
+                return True  # UTF-16: the byte patterns can't see its tags
+            if faction_name.lower() in file_path.lower() and UPGRADE_OBJECT_BYTES.search(data):
+                return True
+            affiliation = AFFILIATION_OPEN_BYTES.search(data)
+            if not affiliation:
+                return False
+            # Neutral/Underworld anywhere after the first <Affiliation> (the block check is DOTALL)
+            if NEUTRAL_NAME_BYTES.search(data, affiliation.start()):
+                return True
+            return bool(faction_affiliation_bytes_pattern(faction_pattern).search(data, affiliation.start()))
+
+def process_xml_file(file_path, faction_name, faction_pattern, spans=None, read_path=None, content=None, record_edits=False, profile=False, cache_dir=None, scan_definitions=False, keep_source=False):
+    """
+    Reads and processes one XML file. Top-level so --jobs workers can pickle it.
+    The file is read as bytes and rewritten by process_xml_bytes() (with catalog spans,
+    only those blocks). read_path is where the file is read from; content skips the
+    read (in-memory document: raw bytes, or text for a document already decoded).
+    With profile, stats['profile'] holds the file's timing, size, block and regex counts.
+    With cache_dir, results are looked up in / added to the result cache.
+    With scan_definitions, stats['definitions'] holds the definition records of a file
+    read here; with keep_source, stats['source'] holds its raw bytes if it changed. Both
+    spare the --jobs parent a second read for the reference check.
+    Returns: (file_path, new_content or None if unchanged, converted_units, stats, error)
+    """
+    read_path = read_path or file_path
+    if profile:
+        started = time.perf_counter()
+        regex_before = REGEX_COUNTS.copy()
+    cache_key = None
+    definitions = None
+    source = None
+    try:
+        if content is None:
+            with open(read_path, 'rb') as f: content = f.read()
+            if scan_definitions:
+                definitions = definition_records(scannable_bytes(content))
+            if keep_source:
+                source = content
+        if cache_dir and not record_edits and not profile:
+            cache_key = result_cache_key(content, spans, file_path, faction_name, faction_pattern)
+            cached = load_cached_result(cache_dir, cache_key)
+            if cached is not None:
+                new_content, converted_units, file_stats = cached
+                if definitions is not None:
+                    file_stats['definitions'] = definitions
+                if source is not None and new_content is not None:
+                    file_stats['source'] = source
+                return file_path, new_content, converted_units, file_stats, None
+        if isinstance(content, bytes):
+            new_content, converted_units, file_stats = process_xml_bytes(content, spans, faction_name, faction_pattern, file_path, record_edits)
+        else:
+            new_content, converted_units, file_stats = process_xml_content(content, faction_name, faction_pattern, file_path, record_edits)
+    except Exception as e:
+        return file_path, None, [], None, str(e)
+    if cache_key is not None:
+        save_cached_result(cache_dir, cache_key, new_content if new_content != content else None, converted_units, file_stats)
+    if definitions is not None:
+        file_stats['definitions'] = definitions
+    if source is not None and new_content != content:
+        file_stats['source'] = source
+    if profile:
+        file_stats['profile'] = {
+            "seconds": round(time.perf_counter() - started, 6),
+            "bytes": len(content),
+            "mode": "spans" if spans is not None else "full",
+            "blocks": file_stats['blocks_matched'],
+            "regex": dict(REGEX_COUNTS - regex_before),
+        }
+    return file_path, (new_content if new_content != content else None), converted_units, file_stats, None
+
+# --- PREFETCH PIPELINE ---
+# Reader threads load files ahead of the regex work (in on-disk order, which keeps a
+# spinning Steam library disk seeking forward), so the disk and the CPU are busy at the
+# same time. At most PREFETCH_DEPTH files are read but not yet consumed, and the rewrite
+# sorts only windows of PREFETCH_DEPTH files, so at most that many results wait for
+# walk order. Together these cap memory.
+PREFETCH_THREADS = 4
+PREFETCH_DEPTH = 32
+
+def disk_order(items, path_of=lambda item: item, index=None, window=None):
+    """
+    items sorted by inode number, a cheap stand-in for their position on disk. Inodes
+    come from the directory index when it has the file, from os.stat otherwise. With
+    window, only each run of window consecutive items is sorted, so in_order() never
+    holds more than window results.
+    """
+    def key(item):
+        inode = index.inode(path_of(item)) if index is not None else None
+        if inode is None:
+            try:
+                inode = os.stat(path_of(item)).st_ino
+            except OSError:
+                return (1, 0)  # Missing files last; the read reports them
+        return (0, inode)
+    if window is None:
+        return sorted(items, key=key)
+    items = list(items)
+    return [item for start in range(0, len(items), window) for item in sorted(items[start:start + window], key=key)]
 
-def apply_cheats(faction_name, faction_pattern):
+def prefetch(items, read, depth=PREFETCH_DEPTH, threads=PREFETCH_THREADS):
+    """
+    Yields (item, data, error) in the order of items while reader threads run up to
+    depth reads ahead. error is the exception read() raised (data is then None).
+    """
+    items = iter(items)
+    pending = collections.deque()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        for item in items:
+            pending.append((item, pool.submit(read, item)))
+            if len(pending) >= depth:
+                break
+        while pending:
+            item, future = pending.popleft()
+            for next_item in items:
+                pending.append((next_item, pool.submit(read, next_item)))
+                break
+            try:
+                yield item, future.result(), None
+            except Exception as e:
+                yield item, None, e
+
+def in_order(keys, results):
+    """Re-emits (key, value) pairs that arrive in any order as values in keys order, as soon as possible."""
+    keys = list(keys)
+    waiting = {}
+    position = 0
+    for key, value in results:
+        waiting[key] = value
+        while position < len(keys) and keys[position] in waiting:
+            yield waiting.pop(keys[position])
+            position += 1
+
+def apply_cheats(faction_name, faction_pattern, jobs=1, store=None, record_edits=False, units_by_file=None):
     print_header(f"Step 3: Applying Modifications for '{faction_name}'")
-    target_dirs = ["Units", "Buildings", "Research", "Upgrades"]
+    target_dirs = TARGET_DIRS
     processed_count = 0
     all_converted_units = []  # Collect all converted units
     
@@ -675,45 +2205,137 @@ def apply_cheats(faction_name, faction_pattern):
     }
     files_with_conversions = []  # Track files that had neutral conversions
     
-    for rel_dir in target_dirs:
-        abs_path = os.path.join(XML_DIR, rel_dir)
-        if not os.path.exists(abs_path): continue
-        
-        for root, dirs, files in os.walk(abs_path):
-            if "Story" in root or "Campaign" in root: continue
+    store = store or XmlDocumentStore()
+    file_paths = store.target_files(target_dirs)
+
+    # Use the backup catalog to open only files (and blocks) that can be relevant
+    catalog = load_unit_catalog(target_dirs) if store.base is None else None
+    source_index = tree_index(store.source_dir)
+    known_definitions = load_saved_definitions(store)
+    faction_key = next((key for key, value in FACTIONS.items() if value == (faction_name, faction_pattern)), None)
+    tasks = []  # (file_path, spans or None for a full scan)
+    contents = {}  # file_path -> document already in memory (not read from disk again)
+    prefiltered = 0
+    catalog_skipped = 0
+    for fp in file_paths:
+        if store.in_memory(fp):
+            contents[fp] = store.read(fp)
+            tasks.append((fp, None))
+            continue
+        if store.base is not None:
+            # Layered store (--all-factions): reuse the blocks parsed once for every faction
+            data, blocks = store.tokens(fp)
+            if blocks is None:
+                tasks.append((fp, None))  # UTF-16 or misdeclared: the full scan decodes it
+                continue
+            spans = relevant_spans(blocks, fp, faction_key, faction_name)
+            if not spans:
+                catalog_skipped += 1
+                continue
+            contents[fp] = data
+            tasks.append((fp, spans))
+            continue
+        read_path = store.source_path(fp)
+        spans = catalog_spans(catalog, fp, faction_key, faction_name, read_path, source_index)
+        if spans == []:
+            catalog_skipped += 1  # Cataloged file without a single relevant block
+            continue
+        if spans is None:
+            try:
+                if not prefilter_file(fp, faction_name, faction_pattern, read_path):
+                    prefiltered += 1
+                    continue
+            except OSError as e:
+                print(f"Skipping {os.path.basename(fp)}: {e}")
+                continue
+        tasks.append((fp, spans))
+    if catalog is not None:
+        print(f"Catalog skipped {catalog_skipped} of {len(file_paths)} file(s) with no relevant block.")
+    elif store.base is not None:
+        print(f"Shared scan skipped {catalog_skipped} of {len(file_paths)} file(s) with no relevant block.")
+
+    profile = PROFILER is not None
+    cache_dir = None if record_edits else result_cache_dir()
+    pooled = jobs > 1 and len(tasks) > 1
+    if pooled:
+        # Largest files first so a big capital-ship file doesn't finish last on its own
+        schedule = sorted(tasks, key=lambda task: os.path.getsize(store.source_path(task[0])), reverse=True)
+        results = {}
+        with ProcessPoolExecutor(max_workers=jobs, initializer=instrument_patterns if profile else None) as pool:
+            futures = [pool.submit(process_xml_file, fp, faction_name, faction_pattern, spans,
+                                   store.source_path(fp), contents.get(fp), record_edits, profile, cache_dir,
+                                   store.rel_path(fp) not in known_definitions, True) for fp, spans in schedule]
+            for future in futures:
+                result = future.result()
+                results[result[0]] = result
+        # Merge in walk order so roster injection sees the same unit order as a serial run
+        ordered_results = (results[fp] for fp, _ in tasks)
+    else:
+        def read_task(task):
+            fp, spans = task
+            if fp in contents:
+                return contents[fp]
+            with open(store.source_path(fp), 'rb') as f: data = f.read()
+            # The reference check needs every file's definitions; take them while the bytes are here
+            if store.rel_path(fp) not in known_definitions:
+                known_definitions[store.rel_path(fp)] = definition_records(scannable_bytes(data))
+            return data
+
+        def process_prefetched():
+            # Reads come off the disk in inode order; results are merged below in walk order.
+            # Sorting window by window bounds how many rewritten files wait in in_order().
+            schedule = disk_order(tasks, lambda task: store.source_path(task[0]), source_index, PREFETCH_DEPTH)
+            for (fp, spans), content, error in prefetch(schedule, read_task):
+                if error is not None:
+                    yield fp, (fp, None, [], None, str(error))
+                    continue
+                result = process_xml_file(fp, faction_name, faction_pattern, spans, store.source_path(fp),
+                                          content, record_edits, profile, cache_dir)
+                if result[1] is not None and isinstance(content, bytes):
+                    store.keep_source(fp, content)  # The reference check compares changed files with their source
+                yield fp, result
+        ordered_results = in_order([fp for fp, _ in tasks], process_prefetched())
+
+    for file_path, new_content, converted_units, file_stats, error in ordered_results:
+        if error:
+            print(f"Skipping {os.path.basename(file_path)}: {error}")
+            continue
+        if 'definitions' in file_stats:
+            known_definitions[store.rel_path(file_path)] = file_stats.pop('definitions')
+        if 'source' in file_stats:
+            store.keep_source(file_path, file_stats.pop('source'))  # Read by a --jobs worker
+        if profile:
+            PROFILER.add_file(store.rel_path(file_path), file_stats.pop('profile'), from_worker=pooled)
+        all_converted_units.extend(converted_units)  # Collect converted units
+        if units_by_file is not None:
+            units_by_file[file_path] = converted_units
+
+        if new_content is not None:
+            try:
+                store.write(file_path, new_content)
+            except Exception as e:
+                print(f"Skipping {os.path.basename(file_path)}: {e}")
+                continue
+            for record in file_stats.pop('blocks', ()):
+                store.note(file_path, dict(record, step="cheats"))
+            processed_count += 1
             
-            # Exclude Ground units from Space Skirmish injection (unless user wants ground modding too)
-            if "Units\\Ground" in root or "Units/Ground" in root: continue
+            # Track stats for debug output
+            for key in total_stats:
+                if key in file_stats:  # Skip units_with_cheats list
+                    total_stats[key] += file_stats[key]
             
-            for file in files:
-                if not file.lower().endswith(".xml"): continue
-                file_path = os.path.join(root, file)
-                
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f: content = f.read()
-                    
-                    new_content, converted_units, file_stats = process_xml_content(content, faction_name, faction_pattern, file_path)
-                    all_converted_units.extend(converted_units)  # Collect converted units
-                    
-                    if new_content != content:
-                        with open(file_path, 'w', encoding='utf-8') as f: f.write(new_content)
-                        processed_count += 1
-                        
-                        # Track stats for debug output
-                        for key in total_stats:
-                            if key in file_stats:  # Skip units_with_cheats list
-                                total_stats[key] += file_stats[key]
-                        
-                        # Track ALL modified files for debug (not just neutral conversions)
-                        rel_path = os.path.relpath(file_path, XML_DIR)
-                        files_with_conversions.append({
-                            'file': rel_path,
-                            'stats': file_stats.copy()
-                        })
-                except Exception as e:
-                    print(f"Skipping {file}: {e}")
+            # Track ALL modified files for debug (not just neutral conversions)
+            rel_path = os.path.relpath(file_path, XML_DIR)
+            files_with_conversions.append({
+                'file': rel_path,
+                'stats': file_stats.copy()
+            })
 
+    if cache_dir:
+        prune_result_cache(cache_dir)
     print(f"Modified {processed_count} files for {faction_name}.")
+    print(f"Prefilter skipped {prefiltered} file(s) with no relevant affiliation (never decoded).")
     
     # Display detailed debug info if enabled
     if DEBUG and files_with_conversions:
@@ -813,10 +2435,263 @@ def apply_cheats(faction_name, faction_pattern):
     
     # Inject converted units into shipyard rosters if any were found
     if all_converted_units:
-        inject_units_into_shipyard_rosters(faction_name, all_converted_units)
-    
+        with profile_stage("injection"):
+            inject_units_into_shipyard_rosters(faction_name, all_converted_units, store)
+    store.end_step()
     return target_dirs
 
+# --- SYMBOL TABLE ---
+# One pass over Data/Xml collects every named object definition (any element with a
+# Name attribute) and its Variant_Of_Existing_Type, so roster entries and structure
+# requirements can be checked against real objects with a dict lookup.
+DEFINITION_PATTERN_BYTES = re.compile(rb'<([A-Za-z_][\w.-]*)\b[^<>]*?\bName="([^"]+)"[^<>]*>')
+VARIANT_PATTERN_BYTES = re.compile(rb'<Variant_Of_Existing_Type>\s*([^<\s]+)\s*</Variant_Of_Existing_Type>', re.IGNORECASE)
+REQUIRED_STRUCTURES_PATTERN = re.compile(r'<Required_Special_Structures>([^<]*)</Required_Special_Structures>', re.IGNORECASE)
+REFERENCE_TOKEN_PATTERN = re.compile(r'[^,\s<>]+')
+REFERENCE_REPORT_LIMIT = 20
+SYMBOL_CACHE_NAME = "_skirmish_god_symbols.json"
+SYMBOL_CACHE_VERSION = 1
+
+class SymbolTable:
+    """Object name -> (name, tag, rel_path), plus the Variant_Of_Existing_Type graph. Lookups ignore case."""
+
+    def __init__(self):
+        self.definitions = {}
+        self.variant_of = {}  # variant -> base it inherits from
+        self.variants = collections.defaultdict(list)  # base -> direct variants
+
+    def define(self, name, tag, rel_path, base=None):
+        key = name.lower()
+        if key in self.definitions:
+            return  # First definition wins, as it does in the game
+        self.definitions[key] = (name, tag, rel_path)
+        if base:
+            self.variant_of[key] = base
+            self.variants[base.lower()].append(name)
+
+    def lookup(self, name):
+        return self.definitions.get(name.lower())
+
+    def variants_of(self, name):
+        """Every object that inherits from name, directly or through other variants."""
+        found = []
+        seen = {name.lower()}
+        pending = [name]
+        while pending:
+            for variant in self.variants.get(pending.pop().lower(), ()):
+                if variant.lower() not in seen:
+                    seen.add(variant.lower())
+                    found.append(variant)
+                    pending.append(variant)
+        return found
+
+def definition_records(data):
+    """(name, tag, variant base or None) for every top-level named object of one file, as UTF-8 bytes (scannable_bytes())."""
+    records = []
+    position = 0
+    while True:
+        match = DEFINITION_PATTERN_BYTES.search(data, position)
+        if not match:
+            return records
+        tag = match.group(1)
+        name = match.group(2).decode('utf-8', 'replace')
+        position = match.end()
+        if match.group(0).endswith(b"/>"):
+            records.append((name, tag.decode('ascii'), None))
+            continue
+        block_end = data.find(b"</" + tag + b">", position)
+        if block_end < 0:
+            block_end = len(data)
+        variant = VARIANT_PATTERN_BYTES.search(data, position, block_end)
+        records.append((name, tag.decode('ascii'), variant.group(1).decode('utf-8', 'replace') if variant else None))
+        position = block_end  # Named children belong to this object, not to the global namespace
+
+def symbol_table(definitions):
+    """SymbolTable of {rel_path: definition records}; definitions are added in that order, so the first one wins like in the game."""
+    table = SymbolTable()
+    for rel_path, records in definitions.items():
+        for name, tag, base in records:
+            table.define(name, tag, rel_path, base)
+    return table
+
+def load_saved_definitions(store):
+    """
+    The source store's definitions, first filled (once per run) with the records the
+    previous run saved in the backup folder for every file whose size/mtime in the
+    directory index still match. Steps add the records of the other files they read.
+    """
+    store = store.source_store()
+    if store.saved_definitions is not None:
+        return store.definitions
+    store.saved_definitions = set()
+    try:
+        with open(os.path.join(BACKUP_DIR, SYMBOL_CACHE_NAME), 'r', encoding='utf-8') as f:
+            stored = json.load(f)
+        saved = stored.get("files", {}) if stored.get("version") == SYMBOL_CACHE_VERSION else {}
+    except (OSError, ValueError):
+        saved = {}
+    index = tree_index(store.source_dir)
+    for rel_path, entry in saved.items():
+        state = index.files.get(rel_path)
+        if state is not None and state[0] == entry["size"] and state[1] == entry["mtime"]:
+            store.definitions.setdefault(rel_path, [tuple(record) for record in entry["definitions"]])
+            store.saved_definitions.add(rel_path)
+    return store.definitions
+
+def save_definitions(store, definitions, index):
+    """Saves the source tree's definitions in the backup folder, keyed by each file's size/mtime."""
+    if not SAVE_INDEXES or not os.path.isdir(BACKUP_DIR):
+        return
+    if store.saved_definitions == set(definitions):
+        return  # Every record came from the saved file
+    cache_path = os.path.join(BACKUP_DIR, SYMBOL_CACHE_NAME)
+    tmp_path = cache_path + ".tmp"
+    files = {rel_path: {"size": index.files[rel_path][0], "mtime": index.files[rel_path][1], "definitions": records}
+             for rel_path, records in definitions.items() if rel_path in index.files}
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"version": SYMBOL_CACHE_VERSION, "files": files}, f, separators=(',', ':'))
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"Warning: Could not save symbol cache: {e}")
+
+def source_symbols(store):
+    """
+    (definitions per rel path, SymbolTable) of the unmodified source tree, scanned once per
+    run and shared by every store layered on the same base. Files a step already read
+    (definitions, decoded documents, parsed blocks) are not read again, and neither are
+    files whose definitions the previous run saved and whose size/mtime are unchanged.
+    """
+    store = store.source_store()
+    if store.symbols is not None:
+        return store.symbols
+    load_saved_definitions(store)
+    index = tree_index(store.source_dir)
+    source_files = index.xml_files()
+
+    def scan_source_file(source_file):
+        path = os.path.join(store.xml_dir, os.path.relpath(source_file, store.source_dir))
+        rel_path = store.rel_path(path)
+        if rel_path in store.definitions:
+            return rel_path, store.definitions[rel_path]
+        if path in store.documents:
+            return rel_path, definition_records(store.documents[path].encode('utf-8'))
+        if path in store.parsed and not store.is_pending(path):
+            return rel_path, definition_records(scannable_bytes(store.parsed[path][0]))
+        with open(source_file, 'rb') as f: return rel_path, definition_records(scannable_bytes(f.read()))
+
+    # Files are read in disk order; only their (small) records wait for walk order
+    scanned = ((source_file, None if error is not None else result) for source_file, result, error
+               in prefetch(disk_order(source_files, index=index), scan_source_file))
+    definitions = dict(result for result in in_order(source_files, scanned) if result is not None)
+    save_definitions(store, definitions, index)
+    store.symbols = (definitions, symbol_table(definitions))
+    return store.symbols
+
+def build_symbol_table(store):
+    """SymbolTable of the store's current tree: the run's source scan, with only the changed documents re-scanned."""
+    definitions, table = source_symbols(store)
+    changed = {}
+    for path in store.changed_paths():
+        records = definition_records(store.read(path).encode('utf-8'))
+        if records != definitions.get(store.rel_path(path)):
+            changed[store.rel_path(path)] = records
+    if not changed:
+        return table  # Conversions rarely rename objects, so the source table usually stands
+    return symbol_table({**definitions, **changed})
+
+def check_references(store):
+    """
+    Checks the roster entries and Required_Special_Structures of every changed document
+    against the symbol table, and lists the variants of the injected units. Dangling
+    references the source files already had are counted but not reported.
+    Returns the number of dangling references this run introduced.
+    """
+    table = build_symbol_table(store)
+    new_dangling = []
+    known_dangling = 0
+    for path in store.changed_paths():
+        content = store.read(path)
+        references = []
+        for roster in parse_build_rosters(content):
+            references.extend((f"{roster.location} roster", unit) for unit in roster.units.values())
+        for match in REQUIRED_STRUCTURES_PATTERN.finditer(content):
+            references.extend(("Required_Special_Structures", name) for name in REFERENCE_TOKEN_PATTERN.findall(match.group(1)))
+        source_tokens = None
+        for where, name in references:
+            if table.lookup(name):
+                continue
+            if source_tokens is None:
+                source_tokens = set(REFERENCE_TOKEN_PATTERN.findall(store.read_source(path)))
+            if name in source_tokens:
+                known_dangling += 1
+            else:
+                new_dangling.append((store.rel_path(path), where, name))
+
+    for rel_path, where, name in new_dangling[:REFERENCE_REPORT_LIMIT]:
+        print(f"WARNING: {os.path.basename(rel_path)}: {where} references undefined object {name}")
+    if len(new_dangling) > REFERENCE_REPORT_LIMIT:
+        print(f"... and {len(new_dangling) - REFERENCE_REPORT_LIMIT} more")
+
+    # Variants inherit the tags of their base, so converting a base changes them too
+    injected = {unit for records in store.notes.values() for record in records
+                if record.get("step") == "roster" for unit in record["added"]}
+    affected = {}
+    for unit in sorted(injected):
+        inherited = [variant for variant in table.variants_of(unit) if variant not in injected]
+        if inherited:
+            affected[unit] = inherited
+    for unit, inherited in list(affected.items())[:REFERENCE_REPORT_LIMIT]:
+        print(f"Variants of converted {unit}: {', '.join(inherited)}")
+    if len(affected) > REFERENCE_REPORT_LIMIT:
+        print(f"... and {len(affected) - REFERENCE_REPORT_LIMIT} more converted unit(s) with variants")
+
+    print(f"Symbol table: {len(table.definitions)} object(s), {len(table.variant_of)} variant(s). "
+          f"{len(new_dangling)} new dangling reference(s), {known_dangling} already in the source; "
+          f"{sum(len(v) for v in affected.values())} variant(s) inherit from converted units.")
+    return len(new_dangling)
+
+# --- COMPACT OUTPUT ---
+# --compact: comments and whitespace-only text between tags are dropped from every
+# file the tool writes, so the game has less to parse at startup. Text values (rosters,
+# numbers, names) and CDATA sections are left exactly as they are.
+COMPACT_OUTPUT = False
+CDATA_PATTERN = re.compile(r'(<!\[CDATA\[.*?\]\]>)', re.DOTALL)
+COMMENT_PATTERN = re.compile(r'<!--.*?-->', re.DOTALL)
+INTER_TAG_SPACE_PATTERN = re.compile(r'(<[^<>]*>)\s+(?=<(/?))')
+
+def compact_xml(text):
+    """Text with comments and insignificant inter-tag whitespace removed."""
+    def strip_space(match):
+        tag, closing_next = match.group(1), match.group(2)
+        if closing_next and not tag.startswith(("</", "<?", "<!")) and not tag.endswith("/>"):
+            return match.group(0)  # <Tag> </Tag>: the whitespace is the value
+        return tag
+
+    pieces = CDATA_PATTERN.split(text)
+    for i in range(0, len(pieces), 2):  # Odd indexes are the CDATA sections
+        pieces[i] = INTER_TAG_SPACE_PATTERN.sub(strip_space, COMMENT_PATTERN.sub('', pieces[i]))
+    return "".join(pieces).strip()
+
+def compact_documents(store):
+    """Compacts every document the store changed. Returns (files, bytes before, bytes after)."""
+    print_header("Compacting Changed Files")
+    before = after = files = 0
+    for path in store.changed_paths():
+        content = store.read(path)
+        compacted = compact_xml(content)
+        before += len(store.encoded(path))
+        files += 1
+        if compacted != content:
+            store.write(path, compacted)
+        after += len(store.encoded(path))
+    store.end_step()
+    saved = before - after
+    print(f"Compacted {files} file(s): {before:,} -> {after:,} bytes "
+          f"(saved {saved:,} bytes, {saved * 100 / before if before else 0:.1f}%).")
+    return files, before, after
+
+# --- VALIDATION ---
 def validate_xml_content(content):
     try:
         ET.fromstring(content)
@@ -829,31 +2704,419 @@ def validate_xml_content(content):
         except:
             return False
 
-def validate_final(target_dirs):
+# Syntax results of the backup's files, cached next to the backup and keyed by
+# size/mtime, so files that are already broken upstream aren't reported as ours
+VALIDATION_NAME = "_skirmish_god_validation.json"
+VALIDATION_VERSION = 1
+
+def check_documents(texts, jobs=1):
+    """validate_xml_content() over a list of texts, in worker processes when jobs > 1."""
+    if jobs > 1 and len(texts) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            return list(pool.map(validate_xml_content, texts, chunksize=max(1, len(texts) // (jobs * 4))))
+    return [validate_xml_content(text) for text in texts]
+
+def backup_failures(rel_paths):
+    """The subset of rel_paths whose backup file already fails the syntax check (cached)."""
+    backup_xml_dir = os.path.join(BACKUP_DIR, "Data", "Xml")
+    if not rel_paths or not os.path.isdir(backup_xml_dir):
+        return set()
+    cache_path = os.path.join(BACKUP_DIR, VALIDATION_NAME)
+    cached = {}
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            stored = json.load(f)
+        if stored.get("version") == VALIDATION_VERSION:
+            cached = stored.get("files", {})
+    except (OSError, ValueError):
+        pass
+
+    index = backup_tree_index()
+    failures = set()
+    updated = False
+    for rel_path in rel_paths:
+        backup_path = os.path.join(backup_xml_dir, *rel_path.split('/'))
+        if rel_path not in index.files:
+            continue  # New file: nothing upstream to compare with
+        size, mtime_ns = index.files[rel_path][:2]
+        entry = cached.get(rel_path)
+        if not entry or entry[0] != size or entry[1] != mtime_ns:
+            try:
+                with open(backup_path, 'rb') as f: valid = validate_xml_content(decode_xml(f.read())[0])
+            except (OSError, UnicodeDecodeError):
+                valid = False
+            entry = cached[rel_path] = [size, mtime_ns, valid]
+            updated = True
+        if not entry[2]:
+            failures.add(rel_path)
+
+    if updated:
+        data = json.dumps({"version": VALIDATION_VERSION, "files": cached}, separators=(',', ':')).encode('utf-8')
+        tmp_path = write_temp_file(cache_path, data, fsync=False)
+        if tmp_path is not None:
+            try:
+                os.replace(tmp_path, cache_path)
+            except OSError as e:
+                print(f"Warning: Could not save validation cache: {e}")
+    return failures
+
+def validate_final(store, jobs=1):
+    """
+    Checks the in-memory content of every changed document. Failures the backup
+    already has are counted but not reported. Returns the number of new warnings.
+    """
     print_header("Step 4: Validating Modified Files Only")
+    paths = store.changed_paths()
+    results = check_documents([store.read(path) for path in paths], jobs)
+    failing = [store.rel_path(path) for path, valid in zip(paths, results) if not valid]
+    known = backup_failures(failing)
+
     warning_count = 0
-    checked_count = 0
-    
-    for rel_dir in target_dirs:
-        abs_path = os.path.join(XML_DIR, rel_dir)
-        if not os.path.exists(abs_path): continue
-        for root, dirs, files in os.walk(abs_path):
-            if "Story" in root or "Campaign" in root: continue
-            for file in files:
-                if file.lower().endswith(".xml"):
-                    checked_count += 1
-                    file_path = os.path.join(root, file)
-                    try:
-                        with open(file_path, 'r', encoding='utf-8') as f: content = f.read()
-                        if not validate_xml_content(content):
-                             print(f"WARNING: {file} syntax check failed. Game may still load it.")
-                             warning_count += 1
-                    except Exception as e:
-                         print(f"ERROR reading {file}: {e}")
-
-    print(f"\nChecked {checked_count} file(s). Found {warning_count} warnings (usually harmless comments).")
+    for rel_path in failing:
+        if rel_path in known: continue
+        print(f"WARNING: {os.path.basename(rel_path)} syntax check failed. Game may still load it.")
+        warning_count += 1
+
+    print(f"\nChecked {len(paths)} changed file(s). Found {warning_count} warnings (usually harmless comments), {len(known)} already failing in the backup.")
+    return warning_count + check_references(store)
+
+# --- DRY RUN PLAN ---
+def write_plan(store, faction_name, plan_path):
+    """Writes the files a real run would change, with sizes, validity and every edit, as JSON."""
+    print_header("Step 4: Writing Change Plan (nothing was modified)")
+    files = {}
+    for path in store.changes:
+        text = store.read(path)
+        original = store.read_source(path)
+        if text == original:
+            continue
+        files[store.rel_path(path)] = {
+            "bytes_before": len(encode_xml(original, store.encoding(path))),
+            "bytes_after": len(store.encoded(path)),
+            "valid": validate_xml_content(text),
+            "edits": store.notes.get(path, []),
+        }
+    plan = {
+        "faction": faction_name,
+        "source": store.source_dir,
+        "files": files,
+    }
+    with open(plan_path, 'w', encoding='utf-8') as f:
+        json.dump(plan, f, indent=1, sort_keys=True)
+    invalid = sum(1 for entry in files.values() if not entry["valid"])
+    print(f"{len(files)} file(s) would change ({invalid} failing the syntax check).")
+    print(f"Plan written to: {plan_path}")
+
+# --- MULTI-FACTION BUILD ---
+def write_overlay(store, out_xml_dir):
+    """
+    Writes every document the store (or its base) changed under out_xml_dir,
+    mirroring Data/Xml. Returns the rel paths written.
+    """
+    base_changes = store.base.changes if store.base is not None else {}
+    items = []
+    for path in store.changed_paths():
+        if path not in base_changes and store.read(path) == store.read_source(path):
+            continue  # Rewritten with identical content
+        dest = os.path.join(out_xml_dir, os.path.relpath(path, XML_DIR))
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        items.append((dest, store.encoded(path)))
+    written, unchanged, _ = write_files(items)
+    return [os.path.relpath(dest, out_xml_dir).replace(os.sep, '/') for dest in written + unchanged]
+
+def run_all_factions(out_dir, jobs):
+    """
+    Builds all four factions from one read of the XML tree: fixes are applied and
+    every file is parsed once into a shared store, then each faction runs on its own
+    layered store and only its changed files are written to <out_dir>/<Faction>/Data/Xml.
+    """
+    print_header("All Factions: Shared Scan")
+    backup_xml = os.path.join(BACKUP_DIR, "Data", "Xml")
+    base = XmlDocumentStore(source_dir=backup_xml if os.path.isdir(backup_xml) else XML_DIR, write_through=False)
+    print(f"Reading from: {base.source_dir}")
+    apply_fixes(base)
+
+    parsed = 0
+    for fp in base.target_files(TARGET_DIRS):
+        try:
+            base.tokens(fp)
+            parsed += 1
+        except OSError as e:
+            print(f"Skipping {os.path.basename(fp)}: {e}")
+    print(f"Parsed {parsed} file(s) once for all factions.")
+
+    summary = []
+    for key in sorted(FACTIONS):
+        faction_name, faction_pattern = FACTIONS[key]
+        store = XmlDocumentStore(base=base, write_through=False)
+        apply_cheats(faction_name, faction_pattern, jobs=jobs, store=store)
+        boost_starbase_income(faction_name, store)
+        if COMPACT_OUTPUT:
+            compact_documents(store)
+        warnings = validate_final(store, jobs)
+
+        faction_dir = os.path.join(out_dir, faction_name)
+        if os.path.isdir(faction_dir):
+            shutil.rmtree(faction_dir)  # Stale files from a previous build would be copied too
+        out_xml_dir = os.path.join(faction_dir, "Data", "Xml")
+        written = write_overlay(store, out_xml_dir)
+        summary.append((faction_name, len(written), warnings, out_xml_dir))
+
+    print_header("All Factions: Output")
+    for faction_name, written, warnings, out_xml_dir in summary:
+        print(f"{faction_name}: {written} changed file(s), {warnings} warning(s) -> {out_xml_dir}")
+    print("\nCopy a faction's Data folder over the mod's Data folder to use that build.")
+
+# --- OVERLAY SWAP ---
+def undo_overlay():
+    """Restores only the files the last overlay run swapped in (or a half-finished swap)."""
+    journal = load_overlay_journal()
+    if journal is None:
+        return None
+    if journal.get("state") != "applied":
+        print("Previous overlay swap did not finish; rolling it back.")
+    restored = rollback_overlay(journal)
+    print(f"Undid overlay for {journal.get('faction')}: {restored} file(s) restored from backup.")
+    return restored
+
+def run_overlay(faction_name, faction_pattern, jobs):
+    """
+    Builds the changed files from the backup into a staging folder, validates them, then
+    swaps them into the mod one os.replace() at a time under a journal. Only the journaled
+    files are undone on the next run, so no full restore is needed.
+    """
+    print_header("Step 1: Undoing Previous Overlay")
+    if not os.path.exists(BACKUP_DIR) or undo_overlay() is None:
+        # No journal: the live tree may hold in-place edits, so start from a full restore
+        restore_backup()
+
+    backup_xml = os.path.join(BACKUP_DIR, "Data", "Xml")
+    store = XmlDocumentStore(source_dir=backup_xml if os.path.isdir(backup_xml) else XML_DIR, write_through=False)
+    apply_fixes(store)
+    apply_cheats(faction_name, faction_pattern, jobs=jobs, store=store)
+    boost_starbase_income(faction_name, store)
+    if COMPACT_OUTPUT:
+        compact_documents(store)
+    validate_final(store, jobs)
+
+    print_header("Step 5: Staging Changed Files")
+    staging_dir = os.path.join(SCRIPT_DIR, STAGING_NAME)
+    if os.path.isdir(staging_dir):
+        shutil.rmtree(staging_dir)
+    staging_xml_dir = os.path.join(staging_dir, "Data", "Xml")
+    written = write_overlay(store, staging_xml_dir)
+    print(f"Staged {len(written)} file(s).")
+
+    print_header("Step 6: Swapping Overlay into Place")
+    # Journal first: if the swap dies halfway, the next run rolls these files back
+    save_overlay_journal({"state": "swapping", "faction": faction_name, "files": written})
+    try:
+        for rel_path in written:
+            os.replace(os.path.join(staging_xml_dir, *rel_path.split('/')),
+                       os.path.join(XML_DIR, *rel_path.split('/')))
+    except OSError as e:
+        print(f"CRITICAL ERROR: Swap failed: {e}")
+        rollback_overlay({"files": written})
+        print("Rolled back; the mod is unchanged.")
+        sys.exit(1)
+    save_overlay_journal({"state": "applied", "faction": faction_name, "files": written})
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    print(f"Swapped {len(written)} file(s) into {XML_DIR}.")
+
+# --- WATCH MODE ---
+# Files whose content depends on other files (converted units end up in their rosters);
+# they are rebuilt from the backup whenever any target file changes
+ROSTER_FILE_NAMES = ("shipyards.xml", "starbases.xml", "research_facilities.xml")
+WATCH_INTERVAL = 5.0
+WATCH_SETTLE_SECONDS = 2.0
+
+def snapshot_tree(root_dir):
+    """{rel_path: (size, mtime_ns)} of every file under root_dir."""
+    files, _ = walk_tree(root_dir)
+    return {rel_path: (st.st_size, st.st_mtime_ns) for rel_path, st in files.items()}
+
+def is_roster_file(path):
+    return (os.path.basename(path).lower() in ROSTER_FILE_NAMES
+            and os.path.join("Buildings", "Space", "Skirmish").lower() in path.lower())
+
+def refresh_backup_files(changed, removed):
+    """Copies updated files from the mod into the backup (they are the new clean version)."""
+    for rel_path in changed:
+        backup_path = os.path.join(BACKUP_DIR, *rel_path.split('/'))
+        os.makedirs(os.path.dirname(backup_path), exist_ok=True)
+        if os.path.exists(backup_path):
+            os.remove(backup_path)  # May be a hard link to the file the update replaced
+        clone_file(os.path.join(WORKING_DIR, *rel_path.split('/')), backup_path,
+                   allow_link=not rel_path.startswith("Data/Xml/"))
+    for rel_path in removed:
+        backup_path = os.path.join(BACKUP_DIR, *rel_path.split('/'))
+        if os.path.exists(backup_path):
+            os.remove(backup_path)
+    forget_tree_index(os.path.join(BACKUP_DIR, "Data", "Xml"))
+
+def reapply_files(faction_name, faction_pattern, file_paths, units_by_file):
+    """
+    Rebuilds file_paths plus every roster file from the backup: fixes, cheats, roster
+    injection (from the converted units of all files) and income. Writes only files whose
+    content differs from the live copy. Returns the written paths.
+    """
+    backup_xml_dir = os.path.join(BACKUP_DIR, "Data", "Xml")
+    store = XmlDocumentStore(source_dir=backup_xml_dir, write_through=False)
+    all_targets = store.target_files(TARGET_DIRS)
+    rebuild = [fp for fp in all_targets if fp in file_paths or is_roster_file(fp)]
+
+    apply_fixes(store)
+    for fp in rebuild:
+        content = store.read(fp) if store.in_memory(fp) else None
+        _, new_content, converted_units, _, error = process_xml_file(
+            fp, faction_name, faction_pattern, read_path=store.source_path(fp), content=content)
+        if error:
+            print(f"Skipping {os.path.basename(fp)}: {error}")
+            continue
+        units_by_file[fp] = converted_units
+        if new_content is not None:
+            store.write(fp, new_content)
+    for fp in [fp for fp in units_by_file if fp not in set(all_targets)]:
+        del units_by_file[fp]  # Removed by the update
+
+    converted_units = [unit for fp in all_targets for unit in units_by_file.get(fp, [])]
+    inject_units_into_shipyard_rosters(faction_name, converted_units, store)
+    boost_starbase_income(faction_name, store)
+    if COMPACT_OUTPUT:
+        compact_documents(store)
+
+    written, _, _ = write_files((fp, store.encoded(fp)) for fp in rebuild)
+    return written
+
+def run_watch(faction_name, faction_pattern, jobs, interval):
+    """
+    Applies the mod once, then polls the mod folder (size/mtime snapshots). When a
+    workshop update replaces files, they are copied into the backup as the new clean
+    version and only they (plus the roster files) are rebuilt and rewritten.
+    """
+    restore_backup()
+    store = XmlDocumentStore(write_through=False)
+    units_by_file = {}
+    apply_fixes(store)
+    apply_cheats(faction_name, faction_pattern, jobs=jobs, store=store, units_by_file=units_by_file)
+    boost_starbase_income(faction_name, store)
+    if COMPACT_OUTPUT:
+        compact_documents(store)
+    validate_final(store, jobs)
+    report_writes(*store.flush())
+
+    print_header(f"Watching {WORKING_DIR} (every {interval:g}s, Ctrl+C to stop)")
+    snapshot = snapshot_tree(WORKING_DIR)
+    try:
+        while True:
+            time.sleep(interval)
+            current = snapshot_tree(WORKING_DIR)
+            if current == snapshot:
+                continue
+            # Steam writes an update in bursts; wait until the folder stops changing
+            while True:
+                time.sleep(min(interval, WATCH_SETTLE_SECONDS))
+                settled = snapshot_tree(WORKING_DIR)
+                if settled == current:
+                    break
+                current = settled
+
+            started = time.perf_counter()
+            changed = [rel for rel, state in current.items() if snapshot.get(rel) != state]
+            removed = [rel for rel in snapshot if rel not in current]
+            print(f"\nUpdate detected: {len(changed)} changed, {len(removed)} removed file(s).")
+            refresh_backup_files(changed, removed)
+
+            xml_prefix = os.path.relpath(XML_DIR, WORKING_DIR).replace(os.sep, '/') + "/"
+            updated = {os.path.join(WORKING_DIR, *rel.split('/')) for rel in changed if rel.startswith(xml_prefix)}
+            if updated or any(rel.startswith(xml_prefix) for rel in removed):
+                written = reapply_files(faction_name, faction_pattern, updated, units_by_file)
+                for fp in written:
+                    st = os.stat(fp)
+                    current[os.path.relpath(fp, WORKING_DIR).replace(os.sep, '/')] = (st.st_size, st.st_mtime_ns)
+                print(f"\nRe-applied {len(written)} file(s) in {time.perf_counter() - started:.2f}s.")
+            # Our own writes are part of the new baseline; anything else changing meanwhile shows up next poll
+            snapshot = current
+    except KeyboardInterrupt:
+        print("\nStopped watching.")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="EAW Remake Skirmish God Tool (Unit Injector & Income Booster)")
+    parser.add_argument("--jobs", type=int, default=1, metavar="N",
+                        help="Process XML files with N worker processes (0 = all cores, default: 1)")
+    parser.add_argument("--faction", metavar="FACTION",
+                        help="Faction number (1-4) or name; skips the menu and the final prompt")
+    parser.add_argument("--all-factions", nargs="?", const="", metavar="OUT",
+                        help="Build all four factions from a single scan into OUT/<Faction>/Data/Xml "
+                             "without touching the mod (default: skirmish_god_builds next to the script)")
+    parser.add_argument("--overlay", action="store_true",
+                        help="Stage only the changed files and swap them in atomically, undoing just "
+                             "the previous overlay instead of restoring the whole mod")
+    parser.add_argument("--undo", action="store_true",
+                        help="Undo the last --overlay run and exit")
+    parser.add_argument("--watch", nargs="?", type=float, const=WATCH_INTERVAL, metavar="SECONDS",
+                        help=f"Keep running and re-apply changes to files a workshop update replaces "
+                             f"(polls every SECONDS, default: {WATCH_INTERVAL:g})")
+    parser.add_argument("--compact", action="store_true",
+                        help="Strip comments and whitespace between tags from every file the tool writes "
+                             "(faster game load; text values are kept as-is)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Don't use or fill the per-file result cache")
+    parser.add_argument("--profile", nargs="?", const="", metavar="PATH",
+                        help="Record per-step and per-file timings, memory and regex counts as JSON "
+                             "(default: skirmish_god_profile.json next to the script)")
+    parser.add_argument("--plan", nargs="?", const="", metavar="PATH",
+                        help="Dry run: write the planned changes as JSON instead of modifying files "
+                             "(default: skirmish_god_plan_<Faction>.json next to the script)")
+    args = parser.parse_args()
+    if args.profile is not None:
+        # Only the single-faction run is instrumented
+        for option, value in (("--plan", args.plan), ("--watch", args.watch),
+                              ("--all-factions", args.all_factions), ("--overlay", args.overlay or None),
+                              ("--undo", args.undo or None)):
+            if value is not None:
+                parser.error(f"--profile cannot be combined with {option}")
+    return args
+
+def select_faction(choice):
+    """Resolves a menu number or faction name to a FACTIONS entry, or None."""
+    if choice in FACTIONS:
+        return FACTIONS[choice]
+    for faction_name, faction_pattern in FACTIONS.values():
+        if faction_name.lower() == choice.lower():
+            return faction_name, faction_pattern
+    return None
+
+def run_plan(faction_name, faction_pattern, jobs, plan_path):
+    """Runs every modification step against an in-memory store and writes the plan."""
+    global SAVE_INDEXES
+    SAVE_INDEXES = False  # A dry run leaves nothing behind but the plan
+    backup_xml = os.path.join(BACKUP_DIR, "Data", "Xml")
+    # Plan against the clean backup, as a real run restores it first
+    store = XmlDocumentStore(source_dir=backup_xml if os.path.isdir(backup_xml) else XML_DIR, write_through=False)
+    print(f"Planning against: {store.source_dir}")
+    apply_fixes(store)
+    apply_cheats(faction_name, faction_pattern, jobs=jobs, store=store, record_edits=True)
+    boost_starbase_income(faction_name, store)
+    write_plan(store, faction_name, plan_path or os.path.join(SCRIPT_DIR, f"skirmish_god_plan_{faction_name}.json"))
 
 def main():
+    args = parse_args()
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    global RESULT_CACHE_ENABLED, COMPACT_OUTPUT, PROFILER
+    RESULT_CACHE_ENABLED = not args.no_cache
+    COMPACT_OUTPUT = args.compact
+
+    if args.all_factions is not None:
+        run_all_factions(args.all_factions or os.path.join(SCRIPT_DIR, "skirmish_god_builds"), jobs)
+        return
+
+    if args.undo:
+        print_header("Undoing Overlay")
+        if undo_overlay() is None:
+            print("No overlay journal found; nothing to undo.")
+        return
+
     print_header("EAW Remake Skirmish God Tool (Unit Injector & Income Booster)")
     print("1. Republic")
     print("2. CIS")
@@ -861,18 +3124,57 @@ def main():
     print("4. Empire")
     print("\nNote: Neutral and Underworld units will be converted to your selected faction for skirmish mode.")
     
-    choice = input("\nSelect Faction to apply God Mode to [1-4]: ").strip()
-    if choice not in FACTIONS:
+    choice = args.faction if args.faction is not None else input("\nSelect Faction to apply God Mode to [1-4]: ")
+    faction = select_faction(choice.strip())
+    if faction is None:
         print("Invalid selection.")
         return
         
-    faction_name, faction_pattern = FACTIONS[choice]
+    faction_name, faction_pattern = faction
+
+    if args.plan is not None:
+        run_plan(faction_name, faction_pattern, jobs, args.plan)
+        return
+
+    if args.watch is not None:
+        run_watch(faction_name, faction_pattern, jobs, args.watch)
+        return
+
+    if args.overlay:
+        run_overlay(faction_name, faction_pattern, jobs)
+        if args.faction is None:
+            print("\nDone. Press Enter to exit.")
+            input()
+        return
     
-    restore_backup()
-    apply_fixes()
-    target_dirs = apply_cheats(faction_name, faction_pattern)
-    boost_starbase_income(faction_name)
-    validate_final(target_dirs)
+    if args.profile is not None:
+        PROFILER = Profiler()
+
+    with profile_stage("restore"):
+        restore_backup()
+    # Every step edits the same in-memory documents; files are written once, after validation
+    store = XmlDocumentStore(write_through=False)
+    with profile_stage("fixes"):
+        apply_fixes(store)
+    with profile_stage("cheats"):
+        apply_cheats(faction_name, faction_pattern, jobs=jobs, store=store)
+    with profile_stage("income"):
+        boost_starbase_income(faction_name, store)
+    if COMPACT_OUTPUT:
+        with profile_stage("compact"):
+            compact_documents(store)
+    with profile_stage("validation"):
+        validate_final(store, jobs)
+    with profile_stage("write"):
+        print_header("Step 5: Writing Changed Files")
+        report_writes(*store.flush())
+
+    if PROFILER is not None:
+        PROFILER.report(args.profile or os.path.join(SCRIPT_DIR, "skirmish_god_profile.json"),
+                        faction=faction_name, jobs=jobs, python=sys.version.split()[0])
+    if args.faction is not None:
+        print("\nDone.")
+        return
     print("\nDone. Press Enter to exit.")
     input()
 